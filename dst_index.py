@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+##==========================================================================##
+## Persistent per-file index of the DST ROOT files for a detector config.  ##
+## Built once with a full scan, then refreshed by only reopening files     ##
+## whose size or modification time changed                                 ##
+##==========================================================================##
+
+import argparse
+import hashlib
+import json
+import os
+import re
+from glob import glob
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+from dst_reader import scan_file
+import directories as stab
+
+prefix = '/data/ana/CosmicRay/Anisotropy/IceCube'
+
+
+""" Default location of the index for a detector configuration """
+def index_file(config, data_dir=None):
+    if data_dir == None:
+        data_dir = stab.data
+    return f'{data_dir}/dst_index_{config}.json'
+
+
+
+""" Load an index, returning an empty index if none exists yet """
+def load_index(indexfile):
+
+    if not os.path.isfile(indexfile):
+        return {}
+
+    with open(indexfile, 'r') as f:
+        return json.load(f)
+
+
+
+""" Save an index, replacing the old one only once fully written """
+def save_index(index, indexfile):
+
+    tmp = f'{indexfile}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, indexfile)
+
+
+
+""" Metadata for a single file: size, mtime, entries, MJD range, runs """
+def file_entry(root_file, step_size='100 MB'):
+
+    st = os.stat(root_file)
+    dates = re.findall('\d{4}-\d{2}-\d{2}', root_file)
+    entry = {
+        'size': st.st_size,
+        'mtime': st.st_mtime,
+        'date': dates[-1] if dates else None,
+        'entries': 0,
+        'mjd_min': None,
+        'mjd_max': None,
+        'runs': [],
+        'duplicates': 0,
+        'jumps': 0,
+        'healthy': True
+    }
+
+    # Unreadable (corrupted) files are kept, but flagged
+    try:
+        scan = scan_file(root_file, step_size)
+    except Exception:
+        entry['healthy'] = False
+        return entry
+
+    run_info = scan['runs']
+    entry['entries'] = scan['entries']
+    entry['duplicates'] = scan['duplicates']
+    entry['jumps'] = len(scan['jumps'])
+    if run_info:
+        entry['mjd_min'] = min([start for n, start, stop in run_info.values()])
+        entry['mjd_max'] = max([stop for n, start, stop in run_info.values()])
+        entry['runs'] = sorted(set([run for date, run in run_info.keys()]))
+
+    return entry
+
+
+
+""" Check whether a file has changed since it was indexed """
+def is_current(root_file, entry):
+
+    try: st = os.stat(root_file)
+    except FileNotFoundError:
+        return False
+
+    return st.st_size == entry['size'] and st.st_mtime == entry['mtime']
+
+
+
+""" Bring an index up to date with a list of files, rescanning only new or
+    modified files and dropping files that no longer exist """
+def update_index(index, files, workers=1, step_size='100 MB'):
+
+    files = sorted(files)
+    stale = [f for f in files if f not in index or not is_current(f, index[f])]
+
+    entry_func = partial(file_entry, step_size=step_size)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            entries = list(pool.map(entry_func, stale))
+    else:
+        entries = list(map(entry_func, stale))
+
+    new_index = {f:index[f] for f in files if f in index}
+    new_index.update(zip(stale, entries))
+    new_index = {f:new_index[f] for f in files}
+
+    return new_index, stale
+
+
+
+""" Content checksum of a file, read in blocks """
+def file_checksum(root_file, blocksize=2**24):
+
+    h = hashlib.sha1()
+    with open(root_file, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+
+""" Extractor options that change the content of a summary: the good run
+    list (by checksum) used for good-time counts. Both engines give the same
+    summary, so the engine is left out. None without good-time counts, so
+    keys match those written before options were recorded """
+def extract_options(goodrunfile=None):
+
+    if goodrunfile == None:
+        return None
+
+    return {'goodrunlist': file_checksum(goodrunfile)}
+
+
+
+""" Identity of a set of input files from their paths and sizes/mtimes (or
+    contents) and the extractor options, used to decide whether a summary
+    needs to be remade """
+def input_key(files, checksum=False, options=None):
+
+    h = hashlib.sha1()
+    if options != None:
+        h.update(json.dumps(options, sort_keys=True).encode())
+    for root_file in sorted(files):
+        if checksum:
+            file_id = file_checksum(root_file)
+        else:
+            st = os.stat(root_file)
+            file_id = f'{st.st_size}:{st.st_mtime_ns}'
+        h.update(f'{root_file}:{file_id}\n'.encode())
+
+    return h.hexdigest()
+
+
+
+""" Key file stored alongside an output summary """
+def key_file(out):
+    return f'{out}.key'
+
+
+
+""" Key recorded for an output summary (None if not recorded) """
+def read_key(out):
+
+    if not os.path.isfile(key_file(out)):
+        return None
+
+    with open(key_file(out), 'r') as f:
+        return f.read().strip()
+
+
+
+""" Record the input key for an output summary, replacing the old key only
+    once fully written """
+def write_key(out, key):
+
+    tmp = f'{key_file(out)}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(key)
+    os.replace(tmp, key_file(out))
+
+
+
+""" Select indexed files by path date, run, and/or MJD range """
+def select_files(index, dates=None, runs=None, tmin=None, tmax=None,
+                 healthy=None, where=None):
+
+    if dates != None:
+        dates = set(dates)
+    if runs != None:
+        runs = set([int(run) for run in runs])
+
+    selected = []
+    for root_file, entry in index.items():
+        if dates != None and entry['date'] not in dates:
+            continue
+        if runs != None and runs.isdisjoint(entry['runs']):
+            continue
+        # Files overlapping the requested time range
+        if tmin != None and (entry['mjd_max'] == None or entry['mjd_max'] < tmin):
+            continue
+        if tmax != None and (entry['mjd_min'] == None or entry['mjd_min'] > tmax):
+            continue
+        if healthy != None and entry['healthy'] != healthy:
+            continue
+        if where != None and not where(entry):
+            continue
+        selected.append(root_file)
+
+    return sorted(selected)
+
+
+
+if __name__ == "__main__":
+
+    # Establish default project-specific paths
+    stab.setup_dirs()
+
+    p = argparse.ArgumentParser(
+            description='Builds or refreshes the per-file DST index')
+    p.add_argument('-c', '--config', dest='config',
+            help='Detector configuration [IC86-2011 - IC86-2022]')
+    p.add_argument('--index', dest='index',
+            default=None,
+            help='Index file (default: stab.data/dst_index_[cfg].json)')
+    p.add_argument('--step-size', dest='step_size',
+            default='100 MB',
+            help='Entries or memory read per chunk')
+    p.add_argument('--workers', dest='workers',
+            type=int, default=1,
+            help='Number of processes used to read input files')
+    args = p.parse_args()
+
+    indexfile = args.index
+    if indexfile == None:
+        indexfile = index_file(args.config)
+
+    step_size = args.step_size
+    if step_size.isdigit():
+        step_size = int(step_size)
+
+    # Listing the directory is cheap compared to reopening every file
+    files = glob(f'{prefix}/{args.config}/**/*.root', recursive=True)
+    index = load_index(indexfile)
+    n_old = len(index)
+
+    print(f'Working on {args.config} ({len(files)} files found)...')
+    index, stale = update_index(index, files, args.workers, step_size)
+    save_index(index, indexfile)
+
+    n_bad = len([f for f, entry in index.items() if not entry['healthy']])
+    print(f'Rescanned {len(stale)} file(s) ({n_old} previously indexed)')
+    print(f'Unreadable files: {n_bad}')
+    print(f'Finished. Index saved to {indexfile}')
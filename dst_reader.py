@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+##==========================================================================##
+## Functions for reading event times and runs from DST ROOT files and      ##
+## summarizing them by day and run                                          ##
+##==========================================================================##
+
+import numpy as np
+from astropy.time import Time
+
+
+""" Group events by (day, run), returning counts and start/stop times.
+    With a good-time mask, counts and start/stop times for the good events
+    are appended: [n, start, stop, nGood, goodStart, goodStop] """
+def aggregate_runs(mjd, runs, good=None):
+
+    run_info = {}
+    if len(mjd) == 0:
+        return run_info
+
+    if good is not None:
+        run_info = aggregate_runs(mjd, runs)
+        good_info = aggregate_runs(mjd[good], runs[good])
+        for key, info in run_info.items():
+            info += good_info.get(key, [0, np.inf, -np.inf])
+        return run_info
+
+    # Sort events into contiguous (day, run) blocks
+    dates = np.floor(mjd).astype(np.int64)
+    order = np.lexsort((runs, dates))
+    mjd, runs, dates = mjd[order], runs[order], dates[order]
+
+    # Index of the first event in each (day, run) block
+    new_block = (dates[1:] != dates[:-1]) | (runs[1:] != runs[:-1])
+    idx = np.flatnonzero(np.concatenate(([True], new_block)))
+
+    counts = np.diff(np.append(idx, len(mjd)))
+    starts = np.minimum.reduceat(mjd, idx)
+    stops = np.maximum.reduceat(mjd, idx)
+
+    for date, run, n, start, stop in zip(dates[idx].tolist(),
+            runs[idx].tolist(), counts.tolist(),
+            starts.tolist(), stops.tolist()):
+        run_info[(date, run)] = [n, start, stop]
+
+    return run_info
+
+
+
+""" Read (day, run) information event-by-event using PyROOT """
+def read_pyroot(infile):
+
+    # Only required for this engine
+    import ROOT
+
+    run_info = {}
+
+    # Open root file and retrieve nEvents
+    f = ROOT.TFile(infile)
+    t = f.CutDST
+    i = 0
+
+    # Run through each event
+    while t.GetEntry(i):
+
+        # Note day, run, and time
+        time = t.ModJulDay
+        key = (int(time), t.RunId)
+        i += 1
+
+        if key not in run_info:
+            run_info[key] = [0, time, time]
+
+        # Running count of event numbers per run and start/stop times
+        info = run_info[key]
+        info[0] += 1
+        info[1] = min(info[1], time)
+        info[2] = max(info[2], time)
+
+    f.Close()
+
+    return run_info
+
+
+
+""" Read (day, run) information from ModJulDay/RunId arrays using uproot.
+    A good-time index (grl_reader.GoodTimeIndex) adds good-time counts """
+def read_uproot(infile, step_size=None, goodtime=None):
+
+    # Only required for this engine
+    import uproot
+
+    run_info = {}
+    branches = ['ModJulDay', 'RunId']
+
+    with uproot.open(infile) as f:
+        t = f['CutDST']
+
+        # Load whole branches at once, or stream fixed-size chunks (entries
+        # or memory, ex: '100 MB') keeping only the partial (day, run)
+        # aggregates between chunks
+        if step_size == None:
+            chunks = [t.arrays(branches, library='np')]
+        else:
+            chunks = t.iterate(branches, step_size=step_size, library='np')
+
+        for arrays in chunks:
+            mjd = arrays['ModJulDay']
+            good = goodtime.mask(mjd) if goodtime != None else None
+            merge_runs(run_info, aggregate_runs(mjd, arrays['RunId'], good))
+
+    return run_info
+
+
+
+""" Single pass over a file collecting run, duplicate, and 86400 information """
+def scan_file(infile, step_size='100 MB'):
+
+    import uproot
+
+    scan = {'entries':0, 'runs':{}, 'duplicates':0, 'jumps':[]}
+    branches = ['ModJulDay', 'RunId', 'LLHZenithDeg']
+
+    # Last event of the previous chunk, so adjacent pairs span chunks
+    prev_mjd, prev_zen = None, None
+
+    with uproot.open(infile) as f:
+        t = f['CutDST']
+        for arrays in t.iterate(branches, step_size=step_size, library='np'):
+
+            mjd = arrays['ModJulDay']
+            zen = arrays['LLHZenithDeg']
+            if len(mjd) == 0:
+                continue
+
+            # Event counts and start/stop times for each (day, run)
+            merge_runs(scan['runs'], aggregate_runs(mjd, arrays['RunId']))
+
+            # Include the final event from the last chunk
+            offset = scan['entries']
+            if prev_mjd != None:
+                mjd_i = np.concatenate(([prev_mjd], mjd))
+                zen_i = np.concatenate(([prev_zen], zen))
+                offset -= 1
+            else:
+                mjd_i, zen_i = mjd, zen
+
+            dt = mjd_i[1:] - mjd_i[:-1]
+            dz = zen_i[1:] - zen_i[:-1]
+
+            # Duplicate events will have the same MJD and zenith
+            scan['duplicates'] += int(np.sum((dt==0) * (dz==0)))
+            # 86400 errors show up as a jump in MJD of about a full day
+            jumps = np.flatnonzero(np.abs(dt) > 0.9) + offset
+            scan['jumps'] += jumps.tolist()
+
+            scan['entries'] += len(mjd)
+            prev_mjd, prev_zen = mjd[-1], zen[-1]
+
+    return scan
+
+
+
+""" Combine (day, run) information, summing counts and widening times
+    (for all events and, when present, good-time events) """
+def merge_runs(run_info, new_info):
+
+    for key, new in new_info.items():
+        if key not in run_info:
+            run_info[key] = list(new)
+            continue
+        info = run_info[key]
+        for i in range(0, len(info), 3):
+            info[i] += new[i]
+            info[i+1] = min(info[i+1], new[i+1])
+            info[i+2] = max(info[i+2], new[i+2])
+
+    return run_info
+
+
+
+""" Format as [date - run - nEvents - livetime] lines, sorted by day and run,
+    adding [- nGood - goodLivetime] with good-time information """
+def format_summary(run_info):
+
+    day_info = []
+    ymds = {}
+    for (date, run), info in sorted(run_info.items()):
+        if date not in ymds:
+            ymds[date] = Time(date, format='mjd', out_subfmt='date').iso
+        n, start, stop = info[:3]
+        livetime = int((stop - start)*86400)
+        line = f'{ymds[date]} - {run} - {n} - {livetime}'
+        if len(info) == 6:
+            n_good, start, stop = info[3:]
+            livetime = int((stop - start)*86400) if n_good else 0
+            line += f' - {n_good} - {livetime}'
+        day_info.append(line)
+
+    return day_info
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+##==========================================================================##
+## Reads each DST ROOT file once, storing event counts for each run along   ##
+## with duplicate events (duplicates/) and 86400 jumps (eightsixfour/)      ##
+##==========================================================================##
+
+import argparse
+import json
+import re
+import os
+from glob import glob
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+from dst_reader import scan_file, merge_runs, format_summary
+import directories as stab
+
+
+""" Scan a file, marking unreadable files instead of stopping """
+def safe_scan(infile, step_size):
+    try:
+        return scan_file(infile, step_size)
+    except Exception as e:
+        return {'error': str(e)}
+
+
+if __name__ == "__main__":
+
+    # Establish default project-specific paths
+    stab.setup_dirs()
+
+    p = argparse.ArgumentParser(
+            description='Single pass over DST ROOT files counting events, ' + \
+            'duplicates, and 86400 errors')
+    p.add_argument('-c', '--config', dest='config',
+            help='Detector configuration [IC86-2011 - IC86-2022]')
+    p.add_argument('-i', '--infiles', dest='infiles',
+            nargs='+',
+            help='File(s) to scan (default: all files for the config)')
+    p.add_argument('-o', '--outdir', dest='outdir',
+            default=f'{stab.data}/scans',
+            help='Output directory for scan results')
+    p.add_argument('--dupdir', dest='dupdir',
+            default=f'{stab.data}/duplicates',
+            help='Output directory for duplicate percentages ' + \
+            '(read by duplicates/duplicate_check.py)')
+    p.add_argument('--summaries', dest='summaries',
+            default=False, action='store_true',
+            help='Also write daily root summaries to stab.root_out ' + \
+            '(requires -c)')
+    p.add_argument('--step-size', dest='step_size',
+            default='100 MB',
+            help='Entries or memory read per chunk')
+    p.add_argument('--workers', dest='workers',
+            type=int, default=1,
+            help='Number of processes used to read input files')
+    args = p.parse_args()
+
+    # Summaries are grouped by the config in their name (root_merge.py)
+    if args.summaries and args.config == None:
+        p.error('--summaries requires -c/--config')
+
+    # Collect all files from specified detector configuration
+    files = args.infiles
+    if files == None:
+        prefix = '/data/ana/CosmicRay/Anisotropy/IceCube'
+        files = glob(f'{prefix}/{args.config}/**/*.root', recursive=True)
+    files = sorted(files)
+
+    step_size = args.step_size
+    if step_size.isdigit():
+        step_size = int(step_size)
+    scanner = partial(safe_scan, step_size=step_size)
+
+    # Read input files one after another, or in a pool of processes
+    if args.workers > 1:
+        pool = ProcessPoolExecutor(max_workers=args.workers)
+        scans = pool.map(scanner, files)
+    else:
+        scans = map(scanner, files)
+
+    # Storage: info[file][entries|duplicates|jumps|runs]
+    info = {}
+    dup_info = {}
+    day_runs = {}
+
+    for i, (root_file, scan) in enumerate(zip(files, scans)):
+
+        f_name = os.path.basename(root_file)
+        print(f'Finished {f_name} ({(i+1)/len(files)*100:.03f}%)...')
+
+        if 'error' in scan:
+            print('Uh oh! Error found!')
+            info[root_file] = scan
+            continue
+
+        # Group run tables by the date in the file path
+        date = re.findall('\d{4}-\d{2}-\d{2}', root_file)[-1]
+        if date not in day_runs:
+            day_runs[date] = {}
+        merge_runs(day_runs[date], scan['runs'])
+
+        # Percentage of duplicates (matches duplicate_finder.py)
+        n = scan['entries']
+        dup_info[f_name] = scan['duplicates'] / n * 100 if n else 0.
+
+        # Json-friendly run information [date, run, nEvents, start, stop]
+        scan['runs'] = [[date_i, run, *run_info]
+                for (date_i, run), run_info in sorted(scan['runs'].items())]
+        info[root_file] = scan
+
+    if args.workers > 1:
+        pool.shutdown()
+
+    # Label output with configuration when available
+    label = args.config if args.config != None else 'files'
+    os.makedirs(args.outdir, exist_ok=True)
+    with open(f'{args.outdir}/scan_{label}.json', 'w') as f:
+        json.dump(info, f)
+    os.makedirs(args.dupdir, exist_ok=True)
+    with open(f'{args.dupdir}/duplicates_{label}.json', 'w') as f:
+        json.dump(dup_info, f)
+
+    # Daily summaries in the same format as root_extractor.py
+    if args.summaries:
+        for date, run_info in sorted(day_runs.items()):
+            out = f'{stab.root_out}/sum_{label}_{date}.txt'
+            with open(out, 'w') as outfile:
+                outfile.writelines('\n'.join(format_summary(run_info)))
+
+    # Report files for the correction scripts
+    for root_file, scan in info.items():
+        if scan.get('jumps'):
+            print(f'86400 error in {root_file} at entries {scan["jumps"]}')
+
+    print(f'Finished. Information saved to {args.outdir}')
@@ -8,7 +8,9 @@ path_to_file = Path(__file__).resolve()
 parent_dir = str(path_to_file.parents[1])
 sys.path.append(parent_dir)
 
-from submitter.pysubmit import pysubmit
+from submitter.pysubmit import pysubmit_batch
+from dst_index import index_file, load_index, select_files
+import directories as stab
 
 
 if __name__ == "__main__":
@@ -25,23 +27,37 @@ if __name__ == "__main__":
     p.add_argument('-o', '--overwrite', dest='overwrite',
             default=False, action='store_true',
             help='Overwrite existing "dupfix" files')
+    p.add_argument('--index', dest='index',
+            default=False, action='store_true',
+            help='Only submit files with duplicates according to the ' + \
+            'DST index (dst_index.py)')
 
     args = p.parse_args()
 
 
     # Collect input files
-    root_path = Path(f'/data/ana/CosmicRay/Anisotropy/IceCube/{args.config}')
-    file_list = sorted(root_path.rglob('*.root'))
+    if args.index:
+        stab.setup_dirs()
+        index = load_index(index_file(args.config))
+        file_list = select_files(index, dates=args.dates,
+                where=lambda entry: entry['duplicates'] > 0)
+        file_list = [Path(f) for f in file_list]
+    else:
+        root_path = Path(f'/data/ana/CosmicRay/Anisotropy/IceCube/{args.config}')
+        file_list = sorted(root_path.rglob('*.root'))
 
     # Skip already-processed files by default
     if not args.overwrite:
-        file_list = [str(f) for f in file_list 
+        file_list = [f for f in file_list
                 if not Path.is_file(f.with_name(f.stem+'_dupfix.root'))]
+    file_list = [str(f) for f in file_list]
 
     # Processes all dates if none given
     if args.dates == None:
         date_list = [re.findall('\d{4}-\d{2}-\d{2}', f)[-1] 
                 for f in file_list]
+    else:
+        date_list = args.dates
 
     # Environment for script
     npx_out = f'{parent_dir}/submitter'
@@ -52,12 +68,19 @@ if __name__ == "__main__":
 
     # Split into days for submission
     date_list = sorted(set(date_list))      # Limit to unique values
+    cmds = []
     for day in date_list:
         day_files = [f for f in file_list if day in f]
+        if day_files == []:
+            print(f'No files found for {day}! Skipping...')
+            continue
         day_str = ' '.join(day_files)
 
         cmd = f'./duplicate_correction.py -i {day_str}'
 
-        pysubmit(cmd, npx_out, sublines=sublines)
+        cmds.append(cmd)
+
+    # Submit all days as a single cluster
+    pysubmit_batch(cmds, npx_out, sublines=sublines)
 
 
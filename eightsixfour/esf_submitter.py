@@ -1,8 +1,17 @@
 #!/usr/bin/env python
 
-import os, re, argparse
+import os, re, sys, argparse
 from glob import glob
 import datetime as dt
+from pathlib import Path
+
+# File index from parent folder
+path_to_file = Path(__file__).resolve()
+parent_dir = str(path_to_file.parents[1])
+sys.path.append(parent_dir)
+
+from dst_index import index_file, load_index, select_files
+import directories as stab
 
 
 if __name__ == "__main__":
@@ -16,6 +25,11 @@ if __name__ == "__main__":
     p.add_argument('-d', '--dates', dest='dates', type=str,
             default=None, nargs='*',
             help='Dates to process [yyyy-mm-dd]')
+    p.add_argument('--index', dest='index',
+            default=False, action='store_true',
+            help='Use the DST index (dst_index.py) instead of scanning ' + \
+            'the data directories. Without dates, selects days with ' + \
+            '86400 jumps')
 
     args = p.parse_args()
 
@@ -24,7 +38,15 @@ if __name__ == "__main__":
     fileList = []
     root_dir = '/data/ana/CosmicRay/Anisotropy/IceCube'
     root_path = f'{root_dir}/{args.config}'
-    masterList = glob(f'{root_path}/**/*.root', recursive=True)
+    if args.index:
+        stab.setup_dirs()
+        index = load_index(index_file(args.config))
+        masterList = select_files(index)
+        if args.dates == None:
+            esf_files = select_files(index, where=lambda e: e['jumps'] > 0)
+            args.dates = [index[f]['date'] for f in esf_files]
+    else:
+        masterList = glob(f'{root_path}/**/*.root', recursive=True)
     masterList.sort()
 
     # Filter by desired dates
@@ -2,12 +2,15 @@
 
 import argparse
 import re
+import os
 import json
-import healpy as hp
 from glob import glob
+from datetime import date as dt_date
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
-from grl_reader import get_livetime, get_bad_runs
+from grl_reader import GoodRunList
+from fits_reader import load_cache, save_cache, update_cache
 import directories as stab
 
 
@@ -15,52 +18,95 @@ if __name__ == "__main__":
 
     p = argparse.ArgumentParser(
             description='Extract and store events and livetime for fits files')
-    p.add_argument('-c', '--config', dest='config',
-            help='Detector configuration to process [IC86-2011 - IC86-2022]')
+    cfg_group = p.add_mutually_exclusive_group(required=True)
+    cfg_group.add_argument('-c', '--config', dest='config',
+            nargs='+',
+            help='Detector configuration(s) to process [IC86-2011 - IC86-2022]')
+    cfg_group.add_argument('--all', dest='all',
+            default=False, action='store_true',
+            help='Process every configuration from IC86-2011 to this year')
+    p.add_argument('--workers', dest='workers',
+            type=int, default=1,
+            help='Number of processes used to read maps')
+    p.add_argument('--map_dir', dest='map_dir',
+            default='/data/user/fmcnally/anisotropy/maps',
+            help='Directory containing one map folder per configuration')
+    p.add_argument('--cache', dest='cache',
+            default=None,
+            help='Json cache of per-map results [default: data/fits_cache.json]')
+    p.add_argument('--no-cache', dest='use_cache',
+            default=True, action='store_false',
+            help='Read every map again, ignoring (and not saving) the cache')
     args = p.parse_args()
 
     # Establish default project-specific paths
     stab.setup_dirs()
 
-    # Storage structure: fits_data[cfg][day][events|livetime]
-    fits_data = defaultdict(lambda: defaultdict(
-                            lambda: defaultdict(int)))
+    # Configurations to process
+    configs = args.config
+    if args.all:
+        configs = [f'IC86-{yy}' for yy in range(2011, dt_date.today().year+1)]
+        configs = [cfg for cfg in configs
+                   if os.path.isdir(f'{args.map_dir}/{cfg}')]
 
-    # Extract detector livetime and bad runs from good run list
+    # Extract detector livetime (without bad runs) from good run list once
+    # for all configurations
     print('Loading livetimes from i3live...')
     goodrunfile = f'{stab.data}/goodrunlist.json'
     run2cfg = f'{stab.data}/run2cfg.json'
-    i3live = get_livetime(goodrunfile, run2cfg)
-    badruns = get_bad_runs(goodrunfile)
+    grl = GoodRunList(goodrunfile)
+    i3live = grl.daily_livetime(run2cfg)
 
-    # Find events for each day
+    # Find map files for each day
     #map_dir = '/data/ana/CosmicRay/Anisotropy/IceCube/twelve_year/maps'
-    map_dir = f'/data/user/fmcnally/anisotropy/maps/{args.config}'
-    fits_files = sorted(glob(f'{map_dir}/*sid_????-??-??.fits'))
-
-    print(f'Working on {args.config} ({len(fits_files)} files found)...')
-    # Run through each fits file
-    for map_file in fits_files:
-
-        # Read fits file
-        map_i = hp.read_map(map_file, verbose=0)
-        date = re.split('_|\.', map_file)[-2]
-
-        # Calculate runtime
-        try: t_i3 = sum([t_run for r, t_run in i3live[args.config][date].items()
-                if r not in badruns])
-        except KeyError:
-            print(f'Date {date} not found in i3live for {args.config}!')
-            t_i3 = 0
-
-        # Save information in dictionary
-        fits_data[args.config][date]['events'] = int(map_i.sum())
-        fits_data[args.config][date]['livetime'] = int(t_i3)
-
-    with open(f'{stab.fits_out}/sum_{args.config}.json', 'w') as f:
-        json.dump(fits_data, f)
-
-
-
-
-
+    cfg_files = {}
+    for cfg in configs:
+        map_dir = f'{args.map_dir}/{cfg}'
+        cfg_files[cfg] = sorted(glob(f'{map_dir}/*sid_????-??-??.fits'))
+        print(f'Working on {cfg} ({len(cfg_files[cfg])} files found)...')
+
+    # Per-map results from earlier runs, keyed by path (size and mtime)
+    cachefile = args.cache
+    if cachefile == None:
+        cachefile = f'{stab.data}/fits_cache.json'
+    cache = load_cache(cachefile) if args.use_cache else {}
+
+    # Read new or changed maps (every configuration) one after another, or
+    # in a pool of processes
+    fits_files = [f for cfg in configs for f in cfg_files[cfg]]
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            stale = update_cache(cache, fits_files, pool=pool)
+    else:
+        stale = update_cache(cache, fits_files)
+    print(f'{len(stale)} of {len(fits_files)} maps read ' + \
+          f'({len(fits_files)-len(stale)} from cache)')
+
+    if args.use_cache:
+        save_cache(cache, cachefile)
+
+    for cfg in configs:
+
+        # Storage structure: fits_data[cfg][day][events|livetime]
+        fits_data = defaultdict(lambda: defaultdict(
+                                lambda: defaultdict(int)))
+
+        # Run through each fits file
+        for map_file in cfg_files[cfg]:
+
+            date = re.split('_|\.', map_file)[-2]
+
+            # Calculate runtime
+            try: t_i3 = i3live[cfg][date]
+            except KeyError:
+                print(f'Date {date} not found in i3live for {cfg}!')
+                t_i3 = 0
+
+            # Save information in dictionary
+            fits_data[cfg][date]['events'] = cache[map_file]['events']
+            fits_data[cfg][date]['livetime'] = int(t_i3)
+
+        with open(f'{stab.fits_out}/sum_{cfg}.json', 'w') as f:
+            json.dump(fits_data, f)
+
+    print(f'Finished. Summaries saved to {stab.fits_out}')
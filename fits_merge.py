@@ -3,6 +3,7 @@
 import json
 from glob import glob
 import directories as stab
+from summary_store import fits_table, save_table, table_file, remove_tables
 
 if __name__ == "__main__":
 
@@ -24,3 +25,9 @@ if __name__ == "__main__":
     with open(f'{stab.data}/fits_summary.json', 'w') as f:
         json.dump(fits_data, f)
 
+    # Columnar copy for rate_finder.py
+    for cfg, cfg_data in fits_data.items():
+        save_table(fits_table(cfg, cfg_data), table_file('fits', cfg))
+    for cfg in remove_tables('fits', fits_data.keys()):
+        print(f'Removed fits table for {cfg} (no longer in summaries)')
+
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+##==========================================================================##
+## Functions for reading HEALPix maps from their memory-mapped FITS binary ##
+## tables, without converting or reordering the full map in memory, and    ##
+## a persistent cache of per-map results keyed by path, size and mtime     ##
+##==========================================================================##
+
+import os
+import json
+import tempfile
+import numpy as np
+from astropy.io import fits
+
+
+""" Accumulator type for summing a column without losing precision """
+def sum_dtype(dtype):
+    if np.issubdtype(dtype, np.integer) or dtype == bool:
+        return np.int64
+    return np.float64
+
+
+
+""" Pixel values of a map as a flat, memory-mapped view (file dtype and
+    ordering) along with the table header """
+def map_column(hdul, field=0):
+
+    hdu = hdul[1]
+    column = hdu.data.field(field)
+
+    return column.reshape(-1), hdu.header
+
+
+
+""" Event sum and pixel statistics of a map, read in one chunked pass """
+def map_stats(map_file, field=0, chunk=2**20):
+
+    with fits.open(map_file, memmap=True) as hdul:
+
+        pixels, header = map_column(hdul, field)
+        acc = sum_dtype(pixels.dtype)
+        npix = len(pixels)
+
+        total, nonzero = acc(0), 0
+        pmin, pmax = np.inf, -np.inf
+        for i in range(0, npix, chunk):
+            block = pixels[i:i+chunk]
+            total += block.sum(dtype=acc)
+            nonzero += int(np.count_nonzero(block))
+            pmin = min(pmin, block.min())
+            pmax = max(pmax, block.max())
+
+        nside = header.get('NSIDE', int(np.sqrt(npix / 12)))
+        ordering = header.get('ORDERING', 'RING')
+        del pixels, block
+
+    return {'events': int(total),
+            'nside': int(nside),
+            'ordering': ordering,
+            'npix': npix,
+            'nonzero': nonzero,
+            'min': float(pmin),
+            'max': float(pmax),
+            'mean': float(total) / npix}
+
+
+
+""" Load a cache of map results, returning an empty cache if none exists """
+def load_cache(cachefile):
+
+    if not os.path.isfile(cachefile):
+        return {}
+
+    with open(cachefile, 'r') as f:
+        return json.load(f)
+
+
+
+""" Save a cache of map results, replacing the old one once fully written.
+    Current entries saved meanwhile by other runs (ex: another config) are
+    kept, and each process writes its own temporary file """
+def save_cache(cache, cachefile):
+
+    try:
+        saved = load_cache(cachefile)
+    except ValueError:
+        saved = {}
+    for map_file, entry in saved.items():
+        if map_file not in cache and is_current(entry, map_file):
+            cache[map_file] = entry
+
+    with tempfile.NamedTemporaryFile('w',
+            dir=os.path.dirname(os.path.abspath(cachefile)),
+            prefix=f'{os.path.basename(cachefile)}.',
+            suffix='.tmp', delete=False) as f:
+        json.dump(cache, f)
+    os.replace(f.name, cachefile)
+
+
+
+""" True if a cached entry still describes the map on disk """
+def is_current(entry, map_file):
+
+    try:
+        st = os.stat(map_file)
+    except FileNotFoundError:
+        return False
+
+    return entry['size'] == st.st_size and entry['mtime'] == st.st_mtime
+
+
+
+""" Cached statistics for a single map, with its size and mtime """
+def cache_entry(map_file):
+
+    st = os.stat(map_file)
+    entry = {'size': st.st_size, 'mtime': st.st_mtime}
+    entry.update(map_stats(map_file))
+
+    return entry
+
+
+
+""" Bring the cache up to date for a list of maps, reading only new or
+    changed files. Entries for maps that no longer exist are evicted.
+    Returns the list of maps that were (re)read """
+def update_cache(cache, map_files, pool=None):
+
+    stale = [f for f in map_files if f not in cache
+             or not is_current(cache[f], f)]
+
+    if pool != None:
+        entries = pool.map(cache_entry, stale, chunksize=8)
+    else:
+        entries = map(cache_entry, stale)
+    for map_file, entry in zip(stale, entries):
+        cache[map_file] = entry
+
+    # Evict maps removed from disk (including ones outside map_files)
+    for map_file in [f for f in cache if not os.path.isfile(f)]:
+        del cache[map_file]
+
+    return stale
@@ -2,81 +2,302 @@
 
 import numpy as np
 import json
+import os
+import pickle
+import hashlib
+import tempfile
 from datetime import datetime as dt
 
+from run2cfg import load_run2cfg
 
-""" Extract bad runs from good run file """
-def get_bad_runs(goodrunfile):
 
-    badruns = []
+""" Set of run numbers with O(1) membership for ints or strings, and a
+    bitmap over the run range for vectorized masks """
+class RunSet:
 
-    # Load I3 good run list from json file
-    with open(goodrunfile, 'r') as f:
-        i3_data = json.load(f)
-        i3_data = i3_data['runs']
+    def __init__(self, runs):
 
-    for run_info in i3_data:
-        if run_info['good_i3'] == False:
-            badruns.append(str(run_info['run']))
+        runs = np.unique(np.asarray(runs, dtype=np.int64))
+        self._set = frozenset(runs.tolist())
+        self.first = runs[0] if len(runs) else 0
+        self.bitmap = np.zeros(runs[-1] - self.first + 1 if len(runs) else 0,
+                dtype=bool)
+        self.bitmap[runs - self.first] = True
 
-    return sorted(set(badruns))
+    def __contains__(self, run):
+        try: return int(run) in self._set
+        except (TypeError, ValueError):
+            return False
 
+    def __iter__(self):
+        return iter(sorted(self._set))
 
+    def __len__(self):
+        return len(self._set)
 
-""" Extract livetimes from good run file """
-def get_livetime(goodrunfile, run2cfgfile):
+    """ Boolean array marking which runs (array of ints) are in the set """
+    def mask(self, runs):
+        i = np.asarray(runs, dtype=np.int64) - self.first
+        inside = (i >= 0) & (i < len(self.bitmap))
+        out = np.zeros(i.shape, dtype=bool)
+        out[inside] = self.bitmap[i[inside]]
+        return out
+
+
+
+""" Sorted, non-overlapping good-time intervals (in MJD) for masking event
+    times with a single binary search """
+class GoodTimeIndex:
+
+    def __init__(self, starts, stops):
+
+        # Merge overlapping or touching intervals
+        order = np.argsort(starts, kind='stable')
+        starts, stops = np.asarray(starts)[order], np.asarray(stops)[order]
+        reach = np.maximum.accumulate(stops) if len(stops) else stops
+        new = np.ones(len(starts), dtype=bool)
+        new[1:] = starts[1:] > reach[:-1]
+        idx = np.flatnonzero(new)
+        self.starts = starts[idx]
+        self.stops = np.maximum.reduceat(stops, idx) if len(idx) else stops
+
+    def __len__(self):
+        return len(self.starts)
+
+    """ True for times (MJD) inside a good-time interval [start, stop) """
+    def mask(self, mjd):
+        mjd = np.asarray(mjd)
+        i = np.searchsorted(self.starts, mjd, side='right') - 1
+        inside = i >= 0
+        inside[inside] = mjd[inside] < self.stops[i[inside]]
+        return inside
+
+
+
+""" Convert datetime64 values to modified julian days """
+def to_mjd(t):
+    mjd0 = np.datetime64('1858-11-17T00:00:00', 's')
+    return (t - mjd0) / np.timedelta64(1, 'D')
+
+
+
+""" Good run list from i3live, parsed once and cached in a binary file
+    next to the json (reused while the json's hash is unchanged) """
+class GoodRunList:
+
+    # Increase when the cached arrays change format
+    cache_version = 2
+
+    def __init__(self, goodrunfile, cache=True):
+
+        self.goodrunfile = goodrunfile
+        self.cachefile = f'{goodrunfile}.cache'
+        self._livetime = {}
+        self._tables = {}
+
+        with open(goodrunfile, 'rb') as f:
+            source = f.read()
+        self.hash = hashlib.sha1(source).hexdigest()
+
+        # Reuse parsed runs if the good run list hasn't changed
+        if cache and self._load_cache():
+            return
+
+        self._parse(json.loads(source)['runs'])
+
+        if cache:
+            self._save_cache()
+
+
+    """ Store run information as compact arrays in run order """
+    def _parse(self, i3_data):
+
+        i3_data = sorted(i3_data, key=lambda run_info: run_info['run'])
+        self.runs = np.array([r['run'] for r in i3_data], dtype=np.int64)
+        self.good = np.array([r['good_i3'] for r in i3_data], dtype=bool)
+
+        # Start/stop times, removing fractions of seconds (NaT if null)
+        tstart = [r['good_tstart'] for r in i3_data]
+        tstop = [r['good_tstop'] or 'NaT' for r in i3_data]
+        self.tstart = np.array(tstart, dtype='datetime64[s]')
+        self.tstop = np.array(tstop, dtype='datetime64[s]')
+
+
+    def _load_cache(self):
+
+        # Any unreadable cache (truncated, old format, ...) is reparsed
+        try:
+            with open(self.cachefile, 'rb') as f:
+                cached = pickle.load(f)
+            if cached.get('hash') != self.hash or \
+                    cached.get('version') != self.cache_version:
+                return False
+            values = {key:cached[key]
+                      for key in ['runs', 'good', 'tstart', 'tstop']}
+        except Exception:
+            return False
+
+        for key, value in values.items():
+            setattr(self, key, value)
+        return True
+
+
+    def _save_cache(self):
+
+        cached = {'hash':self.hash, 'version':self.cache_version,
+                  'runs':self.runs, 'good':self.good,
+                  'tstart':self.tstart, 'tstop':self.tstop}
+
+        # Caching is optional (ex: read-only data directory). Each process
+        # writes its own temporary file, so jobs starting together never
+        # replace the cache with a partly written one
+        tmp = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                    dir=os.path.dirname(os.path.abspath(self.cachefile)),
+                    prefix=f'{os.path.basename(self.cachefile)}.',
+                    suffix='.tmp', delete=False) as f:
+                tmp = f.name
+                pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.cachefile)
+        except OSError:
+            if tmp != None and os.path.exists(tmp):
+                os.remove(tmp)
 
-    i3_livetime = {}
 
-    # Load I3 good run list from json file
-    with open(goodrunfile, 'r') as f:
-        i3_data = json.load(f)
-        i3_data = i3_data['runs']
+    """ Runs marked as bad by i3live """
+    @property
+    def bad_runs(self):
+        if not hasattr(self, '_bad_runs'):
+            self._bad_runs = RunSet(self.runs[~self.good])
+        return self._bad_runs
 
-    # Load run2cfg dictionary from json file
-    with open(run2cfgfile, 'r') as f:
-        run2cfg = json.load(f)
 
-    for run_info in i3_data:
+    """ Good start/stop times for a run (stop is None if missing) """
+    def interval(self, run):
 
-        # Instate each day as a key for the dictionary
-        day = run_info['good_tstart'].split(' ')[0]
-        run = str(run_info['run'])
+        i = np.searchsorted(self.runs, int(run))
+        if i == len(self.runs) or self.runs[i] != int(run):
+            raise KeyError(run)
+
+        start_t = self.tstart[i].astype(dt)
+        if np.isnat(self.tstop[i]):
+            return start_t, None
+        return start_t, self.tstop[i].astype(dt)
+
+
+    """ Interval index of good_tstart - good_tstop windows (good runs only
+        unless good_only is False; runs without a stop time are skipped) """
+    def good_time_index(self, good_only=True):
+
+        keep = ~np.isnat(self.tstop)
+        if good_only:
+            keep &= self.good
+
+        return GoodTimeIndex(to_mjd(self.tstart[keep]), to_mjd(self.tstop[keep]))
+
+
+    """ Livetime for each (config, day, run) as arrays. Runs are split at
+        every midnight they cross. Runs without a stop time have a single
+        nan livetime on their start day """
+    def livetime_table(self, run2cfgfile):
+
+        if run2cfgfile in self._tables:
+            return self._tables[run2cfgfile]
+
+        # Load run2cfg table from json file
+        run2cfg = load_run2cfg(run2cfgfile)
 
         # Ignore runs that are before/after the dates of the run dictionary
-        try: cfg = run2cfg[run]
-        except KeyError:
-            continue
-
-        if cfg not in i3_livetime.keys():
-            i3_livetime[cfg] = {}
-        if day not in i3_livetime[cfg].keys():
-            i3_livetime[cfg][day] = {}
-
-        # Deal with null livetimes
-        if run_info['good_tstop'] == None:
-            #i3_livetime[cfg][day][run] = 'null'
-            i3_livetime[cfg][day][run] = np.nan
-            continue
-
-        # Obtain start/stop times from list, removing fractions of seconds
-        t_i = run_info['good_tstart'].split('.')[0]
-        start_t = dt.strptime(t_i, '%Y-%m-%d %H:%M:%S')
-        t_f = run_info['good_tstop'].split('.')[0]
-        stop_t = dt.strptime(t_f, '%Y-%m-%d %H:%M:%S')
-
-        # Check if run crosses over a day and adjust start/stop times
-        if start_t.day != stop_t.day:
-            day_aft = stop_t.strftime('%Y-%m-%d')
-            if day_aft not in i3_livetime[cfg].keys():
-                i3_livetime[cfg][day_aft] = {}
-            midnight = dt.combine(stop_t, dt.min.time())
-            i3_livetime[cfg][day][run] = (midnight - start_t).seconds
-            i3_livetime[cfg][day_aft][run] = (stop_t - midnight).seconds
-
-        # If no crossover, the run is fully contained in a day
-        else:
-            i3_livetime[cfg][day][run] = (stop_t - start_t).seconds
-
-    return i3_livetime
+        cfgs = run2cfg.configs_for_runs(self.runs)
+        keep = cfgs != ''
+        runs, cfgs = self.runs[keep], cfgs[keep]
+        start, stop = self.tstart[keep], self.tstop[keep]
+
+        # Number of days touched by each run
+        null = np.isnat(stop)
+        day0 = start.astype('datetime64[D]')
+        day1 = np.where(null, day0, stop.astype('datetime64[D]'))
+        ndays = np.maximum((day1 - day0).astype(np.int64) + 1, 1)
+
+        # One row per (run, day), clipping each run to the day's boundaries
+        idx = np.repeat(np.arange(len(runs)), ndays)
+        first = np.cumsum(ndays) - ndays
+        offset = np.arange(len(idx)) - first[idx]
+        days = day0[idx] + offset
+        t0 = np.maximum(start[idx], days.astype('datetime64[s]'))
+        t1 = np.minimum(stop[idx], (days + 1).astype('datetime64[s]'))
+        livetime = (t1 - t0).astype(np.float64)
+        livetime[null[idx]] = np.nan
+
+        table = {'config':cfgs[idx], 'day':days, 'run':runs[idx],
+                 'livetime':livetime}
+        self._tables[run2cfgfile] = table
+
+        return table
+
+
+    """ Total livetime by detector configuration and day, excluding bad runs
+        (and runs without a stop time): livetime[cfg][day] """
+    def daily_livetime(self, run2cfgfile, exclude_bad=True):
+
+        table = self.livetime_table(run2cfgfile)
+        cfgs, days, t = table['config'], table['day'], table['livetime']
+
+        keep = ~np.isnan(t)
+        if exclude_bad:
+            keep &= ~self.bad_runs.mask(table['run'])
+        t = np.where(keep, t, 0)
+
+        # Sum over contiguous (config, day) blocks
+        order = np.lexsort((days, cfgs))
+        cfgs, days, t = cfgs[order], days[order], t[order]
+        new = np.ones(len(t), dtype=bool)
+        new[1:] = (cfgs[1:] != cfgs[:-1]) | (days[1:] != days[:-1])
+        idx = np.flatnonzero(new)
+        sums = np.add.reduceat(t, idx) if len(idx) else t
 
+        daily = {}
+        for cfg, day, t_day in zip(cfgs[idx].tolist(),
+                days[idx].astype(str).tolist(), sums.tolist()):
+            if cfg not in daily:
+                daily[cfg] = {}
+            daily[cfg][day] = t_day
+
+        return daily
+
+
+    """ Livetime by detector configuration, day, and run:
+        livetime[cfg][day][run] """
+    def livetime(self, run2cfgfile):
+
+        if run2cfgfile in self._livetime:
+            return self._livetime[run2cfgfile]
+
+        i3_livetime = {}
+        table = self.livetime_table(run2cfgfile)
+        days = table['day'].astype(str)
+
+        for cfg, day, run, t in zip(table['config'].tolist(), days.tolist(),
+                table['run'].tolist(), table['livetime'].tolist()):
+            if cfg not in i3_livetime:
+                i3_livetime[cfg] = {}
+            if day not in i3_livetime[cfg]:
+                i3_livetime[cfg][day] = {}
+            i3_livetime[cfg][day][str(run)] = t if np.isnan(t) else int(t)
+
+        self._livetime[run2cfgfile] = i3_livetime
+
+        return i3_livetime
+
+
+
+""" Extract bad runs from good run file """
+def get_bad_runs(goodrunfile):
+    return GoodRunList(goodrunfile).bad_runs
+
+
+
+""" Extract livetimes from good run file """
+def get_livetime(goodrunfile, run2cfgfile):
+    return GoodRunList(goodrunfile).livetime(run2cfgfile)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+##==========================================================================##
+## Per-pixel stability check of the daily maps for a detector config.      ##
+## Daily maps are stacked into one memory-mapped (days x npix) array and   ##
+## each day is compared with a rolling reference map of earlier good days, ##
+## over all pixels and in declination bands                                ##
+##==========================================================================##
+
+import argparse
+import json
+import os
+import re
+from glob import glob
+from collections import deque
+import numpy as np
+import healpy as hp
+from astropy.io import fits
+
+from fits_reader import map_column
+import directories as stab
+
+
+""" (Re)build the memory-mapped stack of daily maps, one row per day in the
+    file's own pixel ordering. Reused if the maps have not changed """
+def build_stack(map_files, stackfile, field=0):
+
+    metafile = f'{stackfile}.json'
+    stats = [[f, os.path.getsize(f), os.path.getmtime(f)] for f in map_files]
+
+    if os.path.isfile(stackfile) and os.path.isfile(metafile):
+        with open(metafile, 'r') as f:
+            meta = json.load(f)
+        if meta['files'] == stats:
+            return np.load(stackfile, mmap_mode='r'), meta
+
+    stack = None
+    for i, map_file in enumerate(map_files):
+        with fits.open(map_file, memmap=True) as hdul:
+            pixels, header = map_column(hdul, field)
+            if stack is None:
+                npix = len(pixels)
+                meta = {'files': stats,
+                        'nside': hp.npix2nside(npix),
+                        'ordering': header.get('ORDERING', 'RING')}
+                stack = np.lib.format.open_memmap(f'{stackfile}.tmp',
+                        mode='w+', dtype=np.float32,
+                        shape=(len(map_files), npix))
+            if len(pixels) != stack.shape[1]:
+                raise ValueError(f'{map_file} does not match nside ' + \
+                                 f'{meta["nside"]}')
+            stack[i] = pixels
+            del pixels
+
+    stack.flush()
+    del stack
+    os.replace(f'{stackfile}.tmp', stackfile)
+    with open(metafile, 'w') as f:
+        json.dump(meta, f)
+
+    return np.load(stackfile, mmap_mode='r'), meta
+
+
+
+""" Declination band of each pixel (in the map's ordering) and band edges """
+def dec_bands(nside, ordering, nbands):
+
+    theta, phi = hp.pix2ang(nside, np.arange(hp.nside2npix(nside)),
+                            nest=(ordering.upper() == 'NESTED'))
+    dec = 90 - np.degrees(theta)
+    edges = np.linspace(-90, 90, nbands+1)
+    bands = np.clip(np.digitize(dec, edges) - 1, 0, nbands-1)
+
+    return bands, edges
+
+
+
+""" Chi-square terms of observed counts (per pixel or band) against a
+    reference scaled to the same total (or by a given scale), with the
+    statistical error of the reference included. Returns the terms and the
+    mask of elements used """
+def shape_chi2(obs, ref, min_expected=5, scale=None):
+
+    if scale == None:
+        scale = obs.sum() / ref.sum()
+    expected = scale * ref
+    var = expected + scale**2 * ref
+    use = expected >= min_expected
+
+    resid = np.where(use, (obs - expected)**2 / np.where(use, var, 1), 0)
+
+    return resid, use
+
+
+
+""" Scale of a reference to observed band counts from the median obs/ref
+    ratio of the bands, so a local excess in a few bands does not pull the
+    expectation of every other band down (as scaling to the total would) """
+def band_scale(obs_b, ref_b, min_expected=5):
+
+    total = obs_b.sum() / ref_b.sum()
+    use = total * ref_b >= min_expected
+    if not use.any():
+        return total
+
+    return np.median(obs_b[use] / ref_b[use])
+
+
+
+""" Compare each day of a stack with the sum of the previous (unflagged)
+    days in a rolling window. Returns rows of flagged days and regions """
+def check_stack(stack, dates, bands, edges, window=14, min_days=7,
+                zmax=5, min_expected=5):
+
+    nbands = len(edges) - 1
+    ref = np.zeros(stack.shape[1], dtype=np.float64)
+    ref_days = deque()
+    flagged = []
+
+    for i, day in enumerate(dates):
+
+        obs = np.asarray(stack[i], dtype=np.float64)
+        if obs.sum() == 0:
+            continue
+
+        bad = False
+        if len(ref_days) >= min_days:
+
+            # All pixels: chi-square per pixel, as a significance
+            resid, use = shape_chi2(obs, ref, min_expected)
+            dof = max(int(use.sum()) - 1, 1)
+            chi2 = resid.sum()
+            z_pix = (chi2 - dof) / np.sqrt(2*dof)
+
+            # Declination bands: normalized residual per band, against the
+            # reference scaled by the typical (median) band ratio
+            obs_b = np.bincount(bands, weights=obs, minlength=nbands)
+            ref_b = np.bincount(bands, weights=ref, minlength=nbands)
+            scale_b = band_scale(obs_b, ref_b, min_expected)
+            resid_b, use_b = shape_chi2(obs_b, ref_b, min_expected, scale_b)
+            sign = np.sign(obs_b - scale_b*ref_b)
+            z_band = sign * np.sqrt(resid_b)
+
+            if z_pix > zmax:
+                bad = True
+                scale = obs.sum() / ref.sum()
+                flagged += [[day, 'all pixels', obs.sum(),
+                             scale*ref.sum(), chi2/dof, z_pix]]
+
+            for b in np.flatnonzero(use_b & (np.abs(z_band) > zmax)):
+                bad = True
+                region = f'dec {edges[b]:.0f} to {edges[b+1]:.0f}'
+                flagged += [[day, region, obs_b[b], scale_b*ref_b[b],
+                             resid_b[b], z_band[b]]]
+
+        if bad:
+            continue
+
+        # Include good days in the rolling reference
+        ref += obs
+        ref_days.append(i)
+        if len(ref_days) > window:
+            ref -= stack[ref_days.popleft()]
+
+    return flagged
+
+
+
+if __name__ == "__main__":
+
+    p = argparse.ArgumentParser(
+            description='Compare each daily map with a rolling reference ' + \
+            'map, per pixel and in declination bands')
+    p.add_argument('-c', '--config', dest='config',
+            help='Detector configuration [IC86-2011 - IC86-2022]')
+    p.add_argument('--map_dir', dest='map_dir',
+            default='/data/user/fmcnally/anisotropy/maps',
+            help='Directory containing one map folder per configuration')
+    p.add_argument('--window', dest='window',
+            type=int, default=14,
+            help='Number of previous good days in the reference map')
+    p.add_argument('--min-days', dest='min_days',
+            type=int, default=7,
+            help='Good days needed in the reference before checking')
+    p.add_argument('--nbands', dest='nbands',
+            type=int, default=18,
+            help='Number of declination bands')
+    p.add_argument('--zmax', dest='zmax',
+            type=float, default=5,
+            help='Significance (sigma) marking a day/region as bad')
+    p.add_argument('--min-expected', dest='min_expected',
+            type=float, default=5,
+            help='Minimum expected counts for a pixel/band to be used')
+    p.add_argument('--badmapfile', dest='badmapfile',
+            default='bad_maps.csv',
+            help='Output name for flagged days and regions')
+    args = p.parse_args()
+
+    # Establish default project-specific paths
+    stab.setup_dirs()
+
+    map_dir = f'{args.map_dir}/{args.config}'
+    map_files = sorted(glob(f'{map_dir}/*sid_????-??-??.fits'))
+    dates = [re.split('_|\.', f)[-2] for f in map_files]
+    print(f'Working on {args.config} ({len(map_files)} files found)...')
+    if map_files == []:
+        raise SystemExit(f'No daily maps found in {map_dir}')
+
+    # Stack of daily maps, only read from disk one day at a time
+    stackfile = f'{stab.data}/map_stack_{args.config}.npy'
+    stack, meta = build_stack(map_files, stackfile)
+    bands, edges = dec_bands(meta['nside'], meta['ordering'], args.nbands)
+
+    flagged = check_stack(stack, dates, bands, edges, window=args.window,
+                          min_days=args.min_days, zmax=args.zmax,
+                          min_expected=args.min_expected)
+
+    header = 'Configuration, Day, Region, Observed, Expected, Chi2/dof, Sigma'
+    lines = [header + '\n']
+    for day, region, n, e, chi2, z in flagged:
+        lines += [f'{args.config},{day},{region},{n:.0f},{e:.1f},' + \
+                  f'{chi2:.2f},{z:.1f}\n']
+
+    with open(args.badmapfile, 'w') as f:
+        f.writelines(lines)
+
+    nDays = len(set([row[0] for row in flagged]))
+    print('Finished:')
+    print(f'  {nDays} of {len(dates)} days flagged')
+    print(f'  Flagged days and regions saved to {args.badmapfile}')
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+##==========================================================================##
+## Times the rate calculation of rate_finder.py (rate_engine.compute_rates) ##
+## as the good run list grows, with bad runs held in a sorted list of run   ##
+## strings (the old lookup) or in grl_reader.RunSet                         ##
+##==========================================================================##
+
+import argparse
+import json
+import tempfile
+import time
+import numpy as np
+from datetime import datetime, timedelta
+
+from grl_reader import GoodRunList
+from rate_engine import compute_rates
+from summary_store import root_table, fits_table
+
+
+""" Bad runs as a sorted list of run strings, with the mask used by
+    rate_engine.py done by list membership (linear scans) """
+class RunList:
+
+    def __init__(self, runs):
+        self.runs = sorted([str(r) for r in runs])
+
+    def mask(self, runs):
+        return np.array([str(r) in self.runs for r in runs], dtype=bool)
+
+
+
+""" Synthetic good run list, run2cfg dictionary, and root/fits summary
+    tables with ~runs_per_day runs a day """
+def make_data(nRuns, runs_per_day=8, bad_fraction=0.1, seed=0):
+
+    rng = np.random.default_rng(seed)
+    t0 = datetime(2011, 5, 13)
+    run_length = timedelta(days=1) / runs_per_day
+
+    i3_runs, run2cfg = [], {}
+    root_data, fits_data = {}, {}
+    for i in range(nRuns):
+        run = 118000 + i
+        start = t0 + i*run_length
+        stop = start + run_length
+        i3_runs.append({'run':run,
+            'good_i3':bool(rng.random() > bad_fraction),
+            'good_tstart':start.strftime('%Y-%m-%d %H:%M:%S'),
+            'good_tstop':stop.strftime('%Y-%m-%d %H:%M:%S')})
+        run2cfg[str(run)] = 'IC86-2011'
+
+        day = start.strftime('%Y-%m-%d')
+        if day not in root_data:
+            root_data[day] = {}
+            fits_data[day] = {'events':int(2500*86400), 'livetime':86400}
+        root_data[day][str(run)] = {'events':int(2500*10800),
+                                    'livetime':10800}
+
+    root = root_table('IC86-2011', root_data)
+    fits = fits_table('IC86-2011', fits_data)
+
+    return {'runs':i3_runs}, run2cfg, root, fits
+
+
+if __name__ == "__main__":
+
+    p = argparse.ArgumentParser(
+            description='Benchmark the rate calculation of rate_finder.py ' + \
+            'for growing good run lists')
+    p.add_argument('-n', '--nRuns', dest='nRuns',
+            type=int, nargs='+', default=[1000, 5000, 20000, 40000],
+            help='Good run list sizes to test')
+    args = p.parse_args()
+
+    print(f'{"runs":>8} - {"load (s)":>9} - {"list (s)":>9} - {"set (s)":>9}')
+
+    for nRuns in args.nRuns:
+
+        i3_data, run2cfg, root, fits = make_data(nRuns)
+
+        with tempfile.TemporaryDirectory() as tmp:
+
+            goodrunfile = f'{tmp}/goodrunlist.json'
+            with open(goodrunfile, 'w') as f:
+                json.dump(i3_data, f)
+            run2cfgfile = f'{tmp}/run2cfg.json'
+            with open(run2cfgfile, 'w') as f:
+                json.dump(run2cfg, f)
+
+            # Good run list parsing and livetimes, as in rate_finder.py
+            t = time.perf_counter()
+            grl = GoodRunList(goodrunfile, cache=False)
+            i3_table = grl.livetime_table(run2cfgfile)
+            t_load = time.perf_counter() - t
+
+        # Old behavior: sorted list of run strings
+        badlist = RunList(grl.bad_runs)
+        t = time.perf_counter()
+        runs_list, daily_list = compute_rates(root, fits, i3_table, badlist)
+        t_list = time.perf_counter() - t
+
+        # Hashed run set
+        t = time.perf_counter()
+        runs_set, daily_set = compute_rates(root, fits, i3_table,
+                                            grl.bad_runs)
+        t_set = time.perf_counter() - t
+
+        assert runs_list.tobytes() == runs_set.tobytes()
+        assert daily_list.tobytes() == daily_set.tobytes()
+        print(f'{nRuns:>8} - {t_load:>9.4f} - {t_list:>9.4f} - {t_set:>9.4f}')
@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 
-import argparse, json
+import argparse
 import numpy as np
 import matplotlib.pyplot as plt
 
+from rate_engine import group_starts
+from rate_detectors import detect, detectors
 import directories as stab
 
 def main():
@@ -12,12 +14,20 @@ def main():
     stab.setup_dirs()
 
     p = argparse.ArgumentParser()
-    p.add_argument('--rate_file', dest='rate_file',
-            default=f'{stab.data}/rates.json',
-            help='Json file containing rate information')
+    p.add_argument('--rate_table', dest='rate_table',
+            default=f'{stab.data}/rate_daily.npy',
+            help='Daily rate table saved by rate_finder.py')
+    p.add_argument('--detector', dest='detector',
+            default='ewma', choices=sorted(detectors.keys()),
+            help='Baseline used to flag days: rolling average of good ' + \
+            'days (ewma), rolling median (median), or Poisson ' + \
+            'significance against the rolling median (poisson)')
     p.add_argument('--pdiff', dest='pdiff',
             type=float, default=5,
             help='percent diff marking a significant rate change (5,10,...)')
+    p.add_argument('--zmax', dest='zmax',
+            type=float, default=5,
+            help='Significance marking a bad day (poisson detector)')
     p.add_argument('-o', '--outdir', dest='outdir',
             default=stab.rate_plots,
             help='Output directory for plots')
@@ -27,42 +37,44 @@ def main():
     args = p.parse_args()
 
 
-    # Rate differential
-    dr = args.pdiff/100
+    # Daily rates, and per-run details for flagged days indexed once by
+    # (config, day)
+    try:
+        runs = np.load(f'{stab.data}/rate_runs.npy', mmap_mode='r')
+        daily = np.load(args.rate_table, mmap_mode='r')
+    except FileNotFoundError:
+        raise SystemExit('Rate tables not found. Rerun rate_finder.py')
+    index = day_index(runs, daily)
 
-    # Load rates from summary output
-    with open(args.rate_file, 'r') as f:
-        rates = json.load(f)
+    # Flag days of every config and source in date order
+    opts = {'zmax':args.zmax} if args.detector == 'poisson' else \
+           {'pdiff':args.pdiff}
+    table, baseline, flagged = detect(daily, args.detector, **opts)
+    days = table['day'].astype(str)
 
     # Store information on bad rates
     header = 'Configuration, Day, Source, t (i3), t (root), Events, Rate, Error'
     br_info = [header + '\n']
 
     # Produce rate plots for root and fits data
-    for ftype in rates.keys():
+    for ftype in ['root', 'fits']:
 
         all_rates = []
         all_dates = []
-        configs = sorted(rates[ftype].keys())
+        in_source = table['source'] == ftype
+        configs = np.unique(table['config'][in_source]).tolist()
 
         for cfg in configs:
 
-            cfg_rates = [r for day, r in rates[ftype][cfg].items()]
-            cfg_dates = [day for day, r in rates[ftype][cfg].items()]
+            rows = np.flatnonzero(in_source & (table['config'] == cfg))
+            cfg_rates = table['rate'][rows].tolist()
+            cfg_dates = days[rows].tolist()
             all_rates += cfg_rates
             all_dates += cfg_dates
 
-            # Find comparison # from median of first 7 days
-            comp = np.median(cfg_rates[:7])
-
-            for i, (day, rate) in enumerate(rates[ftype][cfg].items()):
-
-                if (rate >= (1+dr)*comp) or (rate <= (1-dr)*comp):
-                    br_info += save_info(ftype, day, cfg, comp)
-                    continue
-
-                # Include good rates into rolling average
-                comp = (4*comp + rate) / 5
+            for i in rows[flagged[rows]]:
+                br_info += save_info(ftype, days[i], cfg, baseline[i],
+                                     runs, daily, index)
 
             # Plot rate over time
             fig, ax = plt.subplots()
@@ -111,70 +123,98 @@ def main():
 
 
 
-def save_info(ftype, day, cfg, avg_rate):
+""" Rows of the rate tables for each (config, day): daily root row, slice
+    of runs, and daily fits row (None if missing) """
+def day_index(runs, daily):
+
+    index = {}
+    days = daily['day'].astype(str)
+    for i, (cfg, src) in enumerate(zip(daily['config'].tolist(),
+                                       daily['source'].tolist())):
+        entry = index.setdefault((cfg, days[i]), [None, 0, 0, None])
+        entry[0 if src == 'root' else 3] = i
+
+    idx = group_starts(runs['config'], runs['day'])
+    stops = np.append(idx[1:], len(runs))
+    days = runs['day'][idx].astype(str)
+    for i0, i1, cfg, day in zip(idx, stops, runs['config'][idx].tolist(),
+                                days.tolist()):
+        index[(cfg, day)][1:3] = [i0, i1]
+
+    return index
+
+
+
+""" Summary items for a day as written in [cfg]_summary.txt:
+    root and fits totals, and each run """
+def day_items(runs, daily, entry):
+
+    def rate_str(t, n):
+        return f'{3000 if t==0 else n/t:.2f}'
+
+    i_root, i0, i1, i_fits = entry
+    items = []
 
-    with open(f'{stab.data}/{cfg}_summary.txt', 'r') as summary:
-        lines = summary.readlines()
+    if i_root != None:
+        row = daily[i_root]
+        t, n = int(row['livetime']), int(row['events'])
+        items += [['root', '-', str(t), str(n), rate_str(t, n)]]
+
+    for row in runs[i0:i1].tolist():
+        run, t, n, t_i3, in_grl, bad = row[2], row[4], row[3], *row[5:8]
+        t_i3 = 'N/A' if not in_grl else \
+               str(t_i3 if np.isnan(t_i3) else int(t_i3))
+        gb = 'b' if bad else 'g'
+        items += [[f'{run}{gb}', t_i3, str(t), str(n), rate_str(t, n)]]
+
+    if i_fits != None:
+        row = daily[i_fits]
+        t, n = int(row['livetime']), int(row['events'])
+        items += [['fits', str(t), '-', str(n), rate_str(t, n)]]
+
+    return items
+
+
+
+def save_info(ftype, day, cfg, avg_rate, runs, daily, index):
 
     info = [f'{cfg},{day},,,,,,']
     overall_error = ''
-    recording = False
-
-    # Go through all lines in the appropriate summary file
-    for line in lines:
-
-        # Start recording data when the line has the target day
-        if day in line:
-            recording = True
-            continue            # first line just has date information
-
-        if recording:
-
-            items = [item.strip() for item in line.split('-')]
-            error_type = ''
-
-            # Custom rearranging for root and fits summaries
-            if items[0] == 'root':
-                items.insert(1, '-')
-            if items[0] == 'fits':
-                items.insert(2, '-')
-            # Skip default header
-            if items[0] == 'run':
-                continue
-
-            # Automatic error classification (root files)
-            if (ftype == 'root') and (items[0] not in ['root','fits']):
-                rate = float(items[-1])
-                t_root = int(items[2])
-                if rate < avg_rate - np.sqrt(avg_rate):
-                    error_type = 'Low rate'
-                    if overall_error == '':
-                        overall_error = 'Low rate'
-                if rate > avg_rate + np.sqrt(avg_rate):
-                    error_type = 'High rate'
-                    if overall_error == '':
-                        overall_error = 'High rate'
-                if np.abs(86400 - t_root) < 10:
-                    error_type = '864 error'
-                    overall_error = '864 error'
-
-            # Automatic error classification (fits files)
-            if (ftype == 'fits') and (items[0] == 'fits'):
-                rate = float(items[-1])
-                t_i3 = int(items[1])
-                if rate < avg_rate - np.sqrt(avg_rate):
-                    error_type = 'Low rate'
-                    overall_error = 'Low rate'
-                if rate > avg_rate + np.sqrt(avg_rate):
-                    error_type = 'High rate'
-                    overall_error = 'High rate'
 
-            output = ','.join(items + [error_type])
-            info += [f',,{output}\n']
+    # Go through the summary items of the target day
+    entry = index.get((cfg, day), [None, 0, 0, None])
+    for items in day_items(runs, daily, entry):
+
+        error_type = ''
 
-            # Stop recording data if the line has the word fits in it
-            if 'fits' in line:
-                break
+        # Automatic error classification (root files)
+        if (ftype == 'root') and (items[0] not in ['root','fits']):
+            rate = float(items[-1])
+            t_root = int(items[2])
+            if rate < avg_rate - np.sqrt(avg_rate):
+                error_type = 'Low rate'
+                if overall_error == '':
+                    overall_error = 'Low rate'
+            if rate > avg_rate + np.sqrt(avg_rate):
+                error_type = 'High rate'
+                if overall_error == '':
+                    overall_error = 'High rate'
+            if np.abs(86400 - t_root) < 10:
+                error_type = '864 error'
+                overall_error = '864 error'
+
+        # Automatic error classification (fits files)
+        if (ftype == 'fits') and (items[0] == 'fits'):
+            rate = float(items[-1])
+            if rate < avg_rate - np.sqrt(avg_rate):
+                error_type = 'Low rate'
+                overall_error = 'Low rate'
+            if rate > avg_rate + np.sqrt(avg_rate):
+                error_type = 'High rate'
+                overall_error = 'High rate'
+
+        output = ','.join(items + [error_type])
+        info += [f',,{output}\n']
 
     # Update summary line with error type
     info[0] += f'{overall_error}\n'
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+
+##==========================================================================##
+## Detectors for anomalous daily rates. Days are sorted by date and every  ##
+## (source, config) series is padded into one (series x days) array, so   ##
+## each detector runs on all configs and both root/fits sources at once    ##
+##==========================================================================##
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+""" Rows of a daily rate table (see rate_engine.py) as padded arrays with
+    one row per (source, config) series in date order. Returns the series
+    keys, the 2D arrays, the valid mask, and each row's (series, position) """
+def pivot(daily):
+
+    keep = np.flatnonzero(~np.isnan(daily['rate']))
+    order = keep[np.lexsort((daily['day'][keep], daily['config'][keep],
+                             daily['source'][keep]))]
+    src, cfg = daily['source'][order], daily['config'][order]
+
+    new = np.ones(len(order), dtype=bool)
+    new[1:] = (src[1:] != src[:-1]) | (cfg[1:] != cfg[:-1])
+    starts = np.flatnonzero(new)
+    series = np.cumsum(new) - 1
+    pos = np.arange(len(order)) - starts[series]
+    lengths = np.diff(np.append(starts, len(order)))
+
+    shape = (len(starts), lengths.max() if len(starts) else 0)
+    arrays = {}
+    for col in ['rate', 'events', 'livetime']:
+        arrays[col] = np.full(shape, np.nan)
+        arrays[col][series, pos] = daily[col][order]
+    arrays['day'] = np.full(shape, np.datetime64('NaT', 'D'))
+    arrays['day'][series, pos] = daily['day'][order]
+    valid = np.zeros(shape, dtype=bool)
+    valid[series, pos] = True
+
+    keys = list(zip(src[starts].tolist(), cfg[starts].tolist()))
+
+    return keys, arrays, valid, order, series, pos
+
+
+
+""" Median of the first n days of each series (nan padded) """
+def seed_median(x, n=7):
+    return np.nanmedian(x[:, :n], axis=1) if x.shape[1] else np.zeros(0)
+
+
+
+""" Baseline for each day from an exponentially weighted average over the
+    accepted days before it: c -> a*c + (1-a)*x. Computed in blocks of days
+    in closed form (c_t = a^p_t * (c_0 + (1-a) * sum a^(-p_i-1) * x_i)),
+    starting from block b0 with the carried values of earlier blocks """
+def masked_ewma(x, accept, c0, a=0.8, block=64, base=None, carry=None, b0=0):
+
+    nSeries, nDays = x.shape
+    nBlocks = -(-nDays // block)
+    if base is None:
+        base = np.full(x.shape, np.nan)
+        carry = np.zeros((nSeries, nBlocks+1))
+        carry[:, 0] = c0
+
+    for b in range(b0, nBlocks):
+        s = slice(b*block, (b+1)*block)
+        A, xb = accept[:, s], np.where(accept[:, s], x[:, s], 0)
+
+        # Accepted days before each day of the block, and including it
+        p_after = np.cumsum(A, axis=1)
+        p_before = p_after - A
+        terms = (1-a) * xb * a**(-p_after.astype(float))
+        sums = np.cumsum(terms, axis=1) - terms
+
+        base[:, s] = a**p_before * (carry[:, b, None] + sums)
+        carry[:, b+1] = a**p_after[:, -1] * (carry[:, b] + sums[:, -1] +
+                                             terms[:, -1])
+
+    return base, carry
+
+
+
+""" Percent-change detector against an exponentially weighted baseline of
+    the previous accepted days, seeded by the median of the first 7 days.
+    Rejected days are left out of the baseline. Flags are found by fixed
+    point iteration: each pass fixes at least the first day that changed,
+    so the result is the same as the day-by-day loop """
+def ewma_detector(arrays, valid, pdiff=5, a=0.8, seed_days=7, block=64):
+
+    x = arrays['rate']
+    dr = pdiff / 100
+    c0 = seed_median(x, seed_days)
+
+    accept = valid.copy()
+    base, carry = masked_ewma(x, accept, c0, a, block)
+    while True:
+        with np.errstate(invalid='ignore'):
+            flagged = valid & ((x >= (1+dr)*base) | (x <= (1-dr)*base))
+        changed = accept != (valid & ~flagged)
+        changed = np.flatnonzero(changed.any(axis=0))
+        if len(changed) == 0:
+            break
+        accept = valid & ~flagged
+        base, carry = masked_ewma(x, accept, c0, a, block, base, carry,
+                                  b0=changed[0] // block)
+
+    return base, flagged
+
+
+
+""" Windows of up to n previous days for each day of each series (padded
+    nan), and whether each window has at least seed_days days in it """
+def trailing_windows(x, window=15, seed_days=7):
+
+    padded = np.full((x.shape[0], window), np.nan)
+    padded = np.concatenate([padded, x], axis=1)
+    windows = sliding_window_view(padded, window, axis=1)[:, :x.shape[1]]
+    enough = (~np.isnan(windows)).sum(axis=2) >= seed_days
+
+    return windows, enough
+
+
+
+""" Baseline of the previous days of each series (padded nan, so each day
+    uses up to window earlier days); first days use the seed median """
+def trailing_median(x, window=15, seed_days=7):
+
+    windows, enough = trailing_windows(x, window, seed_days)
+
+    base = np.full(x.shape, np.nan)
+    base[enough] = np.nanmedian(windows[enough], axis=1)
+    seed = np.broadcast_to(seed_median(x, seed_days)[:, None], x.shape)
+    base[~enough] = seed[~enough]
+
+    return base
+
+
+
+""" Robust spread (1.4826 * median absolute deviation) of the previous
+    days of each series; first days use the spread of the first days """
+def trailing_mad(x, window=15, seed_days=7):
+
+    windows, enough = trailing_windows(x, window, seed_days)
+
+    spread = np.full(x.shape, np.nan)
+    w = windows[enough]
+    dev = np.abs(w - np.nanmedian(w, axis=1)[:, None])
+    spread[enough] = 1.4826 * np.nanmedian(dev, axis=1)
+
+    first = x[:, :seed_days]
+    dev = np.abs(first - seed_median(x, seed_days)[:, None])
+    seed = 1.4826 * np.nanmedian(dev, axis=1) if x.shape[1] else np.zeros(0)
+    seed = np.broadcast_to(seed[:, None], x.shape)
+    spread[~enough] = seed[~enough]
+
+    return spread
+
+
+
+""" Percent-change detector against the median of the previous days """
+def median_detector(arrays, valid, pdiff=5, window=15, seed_days=7):
+
+    x = arrays['rate']
+    dr = pdiff / 100
+    base = trailing_median(x, window, seed_days)
+    with np.errstate(invalid='ignore'):
+        flagged = valid & ((x >= (1+dr)*base) | (x <= (1-dr)*base))
+
+    return base, flagged
+
+
+
+""" Significance of each day's event count given the trailing median rate
+    and its livetime. Daily counts (~1e8) scatter far more than Poisson, so
+    the variance adds the observed day-to-day spread of the rate (trailing
+    MAD over spread_window days) to the Poisson term """
+def poisson_detector(arrays, valid, zmax=5, window=15, spread_window=30,
+                     seed_days=7):
+
+    x, t = arrays['rate'], arrays['livetime']
+    base = trailing_median(x, window, seed_days)
+    spread = trailing_mad(x, spread_window, seed_days)
+    expected = base * t
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = (arrays['events'] - expected) / np.sqrt(expected + (spread*t)**2)
+        flagged = valid & (np.abs(z) > zmax)
+
+    return base, flagged
+
+
+detectors = {'ewma':ewma_detector,
+             'median':median_detector,
+             'poisson':poisson_detector}
+
+
+
+""" Run a detector on every (source, config) series of a daily rate table.
+    Returns the rows used (sorted by source, config, and day), with the
+    baseline and flag of each row """
+def detect(daily, detector='ewma', **opts):
+
+    keys, arrays, valid, order, series, pos = pivot(daily)
+    base, flagged = detectors[detector](arrays, valid, **opts)
+
+    return daily[order], base[series, pos], flagged[series, pos]
+
+
+
+""" Synthetic daily rate table: rates with a relative day-to-day scatter
+    (much larger than Poisson at ~1e8 events a day), and optional outlier
+    days shifted by outlier_shift """
+def synthetic_daily(nDays=526, scatter=0.01, rate=2500., livetime=80000,
+                    nOutliers=0, outlier_shift=0.2, seed=0):
+
+    from rate_engine import daily_dtype
+
+    rng = np.random.default_rng(seed)
+    daily = np.zeros(2*nDays, dtype=daily_dtype)
+    daily['config'] = 'IC86-2011'
+    daily['day'] = np.tile(np.datetime64('2011-05-13') + np.arange(nDays), 2)
+    daily['source'] = np.repeat(['root', 'fits'], nDays)
+    daily['livetime'] = livetime
+
+    true_rate = rate * (1 + scatter*rng.standard_normal(2*nDays))
+    outliers = rng.choice(2*nDays, nOutliers, replace=False)
+    true_rate[outliers] *= 1 - outlier_shift
+    daily['events'] = rng.poisson(true_rate * livetime)
+    daily['rate'] = daily['events'] / livetime
+
+    return daily, outliers
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    p = argparse.ArgumentParser(
+            description='Check each detector on synthetic daily rates: ' + \
+            'outlier days are found, and a stable series flags ~0 days ' + \
+            'with the poisson detector (percent-change detectors also ' + \
+            'flag stable days once the scatter nears --pdiff)')
+    p.add_argument('--scatter', dest='scatter',
+            type=float, default=0.01,
+            help='Relative day-to-day scatter of the synthetic rates')
+    args = p.parse_args()
+
+    stable, _ = synthetic_daily(scatter=args.scatter)
+    noisy, outliers = synthetic_daily(scatter=args.scatter, nOutliers=10,
+                                      seed=1)
+
+    print(f'{"detector":>8} - {"stable":>6} - {"found":>6} - {"flagged":>7}')
+    failed = False
+    for name in detectors.keys():
+
+        table, base, flagged = detect(stable, name)
+        nStable = int(flagged.sum())
+
+        # Outlier rows matched by their (unique) event counts
+        table, base, flagged = detect(noisy, name)
+        found = np.isin(table['events'], noisy['events'][outliers]) & flagged
+
+        nFound = f'{int(found.sum())}/{len(outliers)}'
+        print(f'{name:>8} - {nStable:>6} - {nFound:>6} - {int(flagged.sum()):>7}')
+        if name == 'poisson' and nStable > 0.005 * len(stable):
+            failed = True
+
+    if failed:
+        raise SystemExit('poisson flagged more than 0.5% of a stable series')
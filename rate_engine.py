@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+
+##==========================================================================##
+## Array-based rate calculations for rate_finder.py. Root runs, fits days, ##
+## and good run list livetimes are joined on (config, day, run) keys, then ##
+## reduced to per-run and daily rates with Poisson errors                  ##
+##==========================================================================##
+
+import numpy as np
+
+# One row per root run
+run_dtype = np.dtype([
+    ('config', 'U12'),
+    ('day', 'datetime64[D]'),
+    ('run', np.int64),
+    ('events', np.int64),
+    ('livetime', np.int64),
+    ('livetime_i3', np.float64),    # nan if missing (or no stop time)
+    ('in_grl', bool),
+    ('bad', bool),
+    ('rate', np.float64),
+    ('rate_err', np.float64)])
+
+# One row per (config, day, source). Root totals exclude bad runs
+daily_dtype = np.dtype([
+    ('config', 'U12'),
+    ('day', 'datetime64[D]'),
+    ('source', 'U4'),
+    ('events', np.int64),
+    ('livetime', np.int64),
+    ('rate', np.float64),
+    ('rate_err', np.float64),
+    ('nRuns', np.int64),
+    ('nBad', np.int64)])
+
+
+""" Single int64 key per (config, day, run). Config is coded by its index
+    in a sorted list of configs, and run is shifted so fits days (-1) fit """
+def pack_keys(configs, cfg, day, run):
+
+    code = np.searchsorted(configs, cfg).astype(np.int64)
+    day = np.asarray(day, dtype='datetime64[D]').astype(np.int64)
+    run = np.asarray(run, dtype=np.int64) + 1
+
+    return (((code << 16) | day) << 25) | run
+
+
+
+""" Index of each left key in the right keys (-1 where missing) """
+def join(left, right):
+
+    if len(right) == 0:
+        return np.full(len(left), -1)
+
+    order = np.argsort(right, kind='stable')
+    i = np.searchsorted(right, left, sorter=order)
+    i = order[np.minimum(i, len(right) - 1)]
+
+    return np.where(right[i] == left, i, -1)
+
+
+
+""" Rate and Poisson error (nan for zero livetime) """
+def rate_and_error(events, livetime):
+
+    t = np.where(livetime > 0, livetime, np.nan)
+    return events / t, np.sqrt(events) / t
+
+
+
+""" Start index of each (config, day) block in a table sorted by config
+    and day """
+def group_starts(cfg, day):
+
+    new = np.ones(len(cfg), dtype=bool)
+    new[1:] = (cfg[1:] != cfg[:-1]) | (day[1:] != day[:-1])
+
+    return np.flatnonzero(new)
+
+
+
+""" Per-run table for root rows, with good run list livetime and bad flags.
+    grl is a GoodRunList.livetime_table output (config, day, run, livetime) """
+def run_rates(root, grl, badruns):
+
+    runs = np.zeros(len(root), dtype=run_dtype)
+    for col in ['config', 'day', 'run', 'events', 'livetime']:
+        runs[col] = root[col]
+
+    configs = np.unique(np.concatenate([root['config'], grl['config']]))
+    i = join(pack_keys(configs, root['config'], root['day'], root['run']),
+             pack_keys(configs, grl['config'], grl['day'], grl['run']))
+    runs['in_grl'] = i >= 0
+    runs['livetime_i3'] = np.where(i >= 0, grl['livetime'][i], np.nan)
+
+    runs['bad'] = badruns.mask(root['run'])
+    runs['rate'], runs['rate_err'] = rate_and_error(runs['events'],
+                                                    runs['livetime'])
+
+    return runs
+
+
+
+""" Daily root totals (without bad runs) and fits rows joined to the days
+    present in root files """
+def daily_rates(runs, fits):
+
+    # Root: reduce contiguous (config, day) blocks, masking bad runs
+    idx = group_starts(runs['config'], runs['day'])
+    good = ~runs['bad']
+    root = np.zeros(len(idx), dtype=daily_dtype)
+    root['config'] = runs['config'][idx]
+    root['day'] = runs['day'][idx]
+    root['source'] = 'root'
+    if len(idx):
+        root['events'] = np.add.reduceat(runs['events'] * good, idx)
+        root['livetime'] = np.add.reduceat(runs['livetime'] * good, idx)
+        root['nRuns'] = np.diff(np.append(idx, len(runs)))
+        root['nBad'] = np.add.reduceat((~good).astype(np.int64), idx)
+    root['rate'], root['rate_err'] = rate_and_error(root['events'],
+                                                    root['livetime'])
+
+    # Fits: days with root data only
+    configs = np.unique(np.concatenate([root['config'], fits['config']]))
+    i = join(pack_keys(configs, root['config'], root['day'], -1),
+             pack_keys(configs, fits['config'], fits['day'], fits['run']))
+    i = i[i >= 0]
+    maps = np.zeros(len(i), dtype=daily_dtype)
+    for col in ['config', 'day', 'events', 'livetime']:
+        maps[col] = fits[col][i]
+    maps['source'] = 'fits'
+    maps['rate'], maps['rate_err'] = rate_and_error(maps['events'],
+                                                    maps['livetime'])
+
+    return np.concatenate([root, maps])
+
+
+
+""" Per-run and daily tables from root and fits summary tables (see
+    summary_store.py), a good run list livetime table, and bad runs """
+def compute_rates(root, fits, grl, badruns):
+
+    runs = run_rates(root, grl, badruns)
+    daily = daily_rates(runs, fits)
+
+    return runs, daily
+
+
+
+""" Daily rates in the rates.json layout: rates[source][cfg][day]. Every
+    root config has an entry for both sources. Days without livetime are
+    left out """
+def rates_dict(daily, configs):
+
+    rates = {'root':{c:{} for c in configs}, 'fits':{c:{} for c in configs}}
+    keep = ~np.isnan(daily['rate'])
+    days = daily['day'].astype(str)
+
+    for src, cfg, day, rate in zip(daily['source'][keep].tolist(),
+            daily['config'][keep].tolist(), days[keep].tolist(),
+            daily['rate'][keep].tolist()):
+        if cfg in rates[src]:
+            rates[src][cfg][day] = rate
+
+    return rates
+
+
+
+""" Text summary of a config: each day's root total, its runs, and the
+    fits total (when available) """
+def text_summary(runs, daily, cfg):
+
+    h = f'\trun     - {"t (i3)":<7} - {"t (root)":<7} - {"events":<10} - rate'
+    def day_formatter(t, n, root_fits):
+        rate = 3000 if t==0 else n/t
+        return f'\t{root_fits:<7} - {t:<7} - {n:<11} - {rate:.2f}'
+    def run_formatter(run, gb, t_i3, t, n):
+        rate = 3000 if t==0 else n/t
+        return f'\t{run}{gb} - {t_i3:<7} - {t:<7} - {n:<11} - {rate:.2f}'
+
+    runs = runs[runs['config'] == cfg]
+    daily = daily[daily['config'] == cfg]
+    fits = daily[daily['source'] == 'fits']
+    fits = dict(zip(fits['day'].astype(str).tolist(), fits.tolist()))
+    root = daily[daily['source'] == 'root']
+
+    cfg_info = []
+    idx = np.append(group_starts(runs['config'], runs['day']), len(runs))
+    for j, day_row in enumerate(root.tolist()):
+
+        day = str(day_row[1])
+        cfg_info += [f'\n{day}']
+        cfg_info += [day_formatter(day_row[4], day_row[3], 'root')]
+
+        cfg_info += [h]
+        for row in runs[idx[j]:idx[j+1]].tolist():
+            t_i3 = 'N/A'
+            if row[6]:
+                t_i3 = row[5] if np.isnan(row[5]) else int(row[5])
+            gb = 'b' if row[7] else 'g'
+            cfg_info += [run_formatter(row[2], gb, t_i3, row[4], row[3])]
+
+        if day in fits:
+            cfg_info += [day_formatter(fits[day][4], fits[day][3], 'fits')]
+
+    return cfg_info
@@ -7,114 +7,96 @@
 ########################################################################
 
 
-import re
+import argparse
 import json
+import os
+import numpy as np
 
-from grl_reader import get_livetime, get_bad_runs
+from grl_reader import GoodRunList
+from summary_store import load_summary, save_table, stored_configs
+from summary_store import convert_json
+from rate_engine import compute_rates, rates_dict, text_summary
 import directories as stab
 
 
 if __name__ == "__main__":
 
+    p = argparse.ArgumentParser(
+            description='Calculate daily and per-run rates from root ' + \
+            'files, fits files, and the good run list')
+    p.add_argument('--no-text', dest='text',
+            default=True, action='store_false',
+            help='Skip writing the [cfg]_summary.txt files')
+    args = p.parse_args()
+
     # Load default project-associated paths
     stab.setup_dirs()
 
-    # File locations
-    map_dir = '/data/user/fmcnally/anisotropy/maps'
-
     # Extract livetime and bad runs from good run list
     goodrunfile = f'{stab.data}/goodrunlist.json'
     run2cfg = f'{stab.data}/run2cfg.json'
-    i3_livetime = get_livetime(goodrunfile, run2cfg)
-    badruns = get_bad_runs(goodrunfile)
+    grl = GoodRunList(goodrunfile)
+    i3_table = grl.livetime_table(run2cfg)
+    badruns = grl.bad_runs
+
+    # Build the summary store from json summaries made before it existed
+    for source in ['root', 'fits']:
+        json_file = f'{stab.data}/{source}_summary.json'
+        if stored_configs(source) == [] and os.path.isfile(json_file):
+            print(f'No {source} tables in the summary store. ' + \
+                  f'Converting {json_file}...')
+            convert_json(source)
 
     # Load map counts for all detector configurations
     print('Loading fits data...')
-    with open(f'{stab.data}/fits_summary.json', 'r') as f:
-        fits_data = json.load(f)
+    fits_data = load_summary('fits')
 
     # Load counts and livetimes from root files
     print('Loading root data...')
-    with open(f'{stab.data}/root_summary.json', 'r') as f:
-        root_data = json.load(f)
+    root_data = load_summary('root')
+    if len(root_data) == 0:
+        raise SystemExit('No root data found in the summary store. ' + \
+                         'Run root_merge.py first')
+    if len(fits_data) == 0:
+        print('Warning: no fits data found in the summary store!')
 
     # Use root data to get list of detector configurations
-    configs = sorted(root_data.keys())
-
-    # String formatting for header, daily output, and run details
-    h = f'\trun     - {"t (i3)":<7} - {"t (root)":<7} - {"events":<10} - rate'
-    def day_formatter(t, n, root_fits):
-        rate = 3000 if t==0 else n/t
-        return f'\t{root_fits:<7} - {t:<7} - {n:<11} - {rate:.2f}'
-    def run_formatter(run, t_i3, t, n):
-        gb = 'b' if run in badruns else 'g'
-        rate = 3000 if t==0 else n/t
-        return f'\t{run}{gb} - {t_i3:<7} - {t:<7} - {n:<11} - {rate:.2f}'
-
-
-    # Save rates from root and fits files
-    rates = {'root':{c:{} for c in configs}, 'fits':{c:{} for c in configs}}
-
-    # Run through each config, storing all root|fits info
-    for cfg in configs:
-
-        # Store rates and dates for rate check, cfg_info for output
-        cfg_info = []
-
-        # Run through every day present in root files
-        i = 0
-        for day, runs in root_data[cfg].items():
-
-            # Root summary for the day
-            cfg_info += [f'\n{day}']
-            t_root = sum([run['livetime'] for r, run in runs.items()
-                        if r not in badruns])
-            n_root = sum([run['events'] for r, run in runs.items()
-                        if r not in badruns])
-            cfg_info += [day_formatter(t_root, n_root, 'root')]
-            rates['root'][cfg][day] = n_root/t_root
-
-            # Individual run summaries (from root files)
-            cfg_info += [h]
-            for run, info in runs.items():
-
-                # Note if run is not in good run list
-                try: t_i3 = i3_livetime[cfg][day][run]
-                except KeyError:
-                    print(f'{cfg} {day} Run{run} not found in good run list!')
-                    t_i3 = 'N/A'
-
-                t_root = info['livetime']
-                n_root = info['events']
-                cfg_info += [run_formatter(run, t_i3, t_root, n_root)]
-
-            # Skip the fits writing part without the necessary maps
-            if cfg not in fits_data.keys():
-                continue
-
-            # Note if element doesn't have fits data
-            if day not in fits_data[cfg].keys():
-                print(f'Warning: {day} ({cfg}) has no fits files!')
-                continue
-
-            # Fits/i3 summary for the day
-            n_fits = fits_data[cfg][day]['events']
-            t_i3   = fits_data[cfg][day]['livetime']
-            cfg_info += [day_formatter(t_i3, n_fits, 'fits')]
-            rates['fits'][cfg][day] = n_fits/t_i3
-
-        # Save text in summary text file
-        out = f'{stab.data}/{cfg}_summary.txt'
-        with open(out, 'w') as outfile:
-            outfile.writelines('\n'.join(cfg_info))
+    configs = np.unique(root_data['config']).tolist()
+
+    # Join root runs, fits days, and i3 livetimes in one pass
+    runs, daily = compute_rates(root_data, fits_data, i3_table, badruns)
+
+    # Note runs missing from the good run list
+    for cfg, day, run in runs[['config','day','run']][~runs['in_grl']].tolist():
+        print(f'{cfg} {day} Run{run} not found in good run list!')
+
+    # Note days without fits data (for configs with maps)
+    root_days = daily[daily['source'] == 'root'][['config','day']].tolist()
+    fits_days = set(daily[daily['source'] == 'fits'][['config','day']].tolist())
+    fits_cfgs = set(fits_data['config'].tolist())
+    for cfg, day in root_days:
+        if cfg in fits_cfgs and (cfg, day) not in fits_days:
+            print(f'Warning: {day} ({cfg}) has no fits files!')
+
+    # Save per-run and daily rate tables (used by rate_check.py)
+    save_table(runs, f'{stab.data}/rate_runs.npy')
+    save_table(daily, f'{stab.data}/rate_daily.npy')
+
+    # Save text in summary text files
+    if args.text:
+        for cfg in configs:
+            cfg_info = text_summary(runs, daily, cfg)
+            out = f'{stab.data}/{cfg}_summary.txt'
+            with open(out, 'w') as outfile:
+                outfile.writelines('\n'.join(cfg_info))
 
     # Save rate information
+    rates = rates_dict(daily, configs)
+    for cfg, day in daily[['config','day']][np.isnan(daily['rate'])].tolist():
+        print(f'Warning: {day} ({cfg}) has no livetime!')
+
     out = f'{stab.data}/rates.json'
     with open(out, 'w') as f:
         json.dump(rates, f)
 
     print(f'Finished! Summary output saved to {stab.data}')
-
-
-
-
@@ -1,71 +1,128 @@
 #!/usr/bin/env python
 
 import argparse
-import ROOT
-from astropy.time import Time
+import json
+import os
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
+from dst_reader import read_pyroot, read_uproot, merge_runs, format_summary
+from dst_index import input_key, read_key, write_key, extract_options
+from grl_reader import GoodRunList
 
-if __name__ == "__main__":
 
-    p = argparse.ArgumentParser(
-            description='Extracts and stores nEvents and livetime from ' + \
-            'ROOT files, organized by each run in each day')
-    p.add_argument('-i', '--infiles', dest='infiles',
-            nargs='+',
-            help='File(s) to retrieve the information from')
-    p.add_argument('-o', '--out', dest='out',
-            help='Name of output text file to store info')
-    args = p.parse_args()
+""" Summarize one collection of files (~1 day), saving to a text file """
+def extract(infiles, out, reader, pool=None, checksum=False, options=None):
 
+    # Data storage: run_info[(date, run)] = [nEvents, start, stop(, good...)]
+    run_info = {}
 
-    # Data storage
-    d = {}
+    # Read input files one after another, or in a pool of processes
+    if pool != None:
+        file_infos = pool.map(reader, infiles)
+    else:
+        file_infos = map(reader, infiles)
 
-    # Run through each input file
-    for infile in args.infiles:
+    # Reduce per-file run tables in input order (output is identical for
+    # any number of workers)
+    for infile, file_info in zip(infiles, file_infos):
+        print(f'Finished {infile}...')
+        merge_runs(run_info, file_info)
 
-        print(f'Working on {infile}...')
-
-        # Open root file and retrieve nEvents
-        f = ROOT.TFile(infile)
-        t = f.CutDST
-        i = 0
+    # Calculate livetime and nEvents for each run in a day
+    day_info = format_summary(run_info)
 
-        # Run through each event
-        while t.GetEntry(i):
+    # Save information in text file, only replacing the output once complete
+    tmp = f'{out}.tmp'
+    with open(tmp, 'w') as outfile:
+        outfile.writelines('\n'.join(day_info))
+    os.replace(tmp, out)
 
-            # Note day, run, and time
-            time = t.ModJulDay
-            date = int(time)
-            run = t.RunId
-            i += 1
+    # Record the identity of the inputs for incremental resubmission
+    write_key(out, input_key(infiles, checksum, options))
 
-            # Use day as key in storage dictionary
-            if date not in d.keys():
-                d[date] = {}
-            # Use run # as key in day sub-dictionary
-            if run not in d[date].keys():
-                d[date][run] = {'nEvents':0, 'stop':time, 'start':time}
+    print(f'Finished. Information saved to {out}')
 
-            # Running count of event numbers per run
-            d[date][run]['nEvents'] += 1
 
-            # Update start and stop times for each run
-            if time < d[date][run]['start']:
-                d[date][run]['start'] = time
-            if time > d[date][run]['stop']:
-                d[date][run]['stop'] = time
+if __name__ == "__main__":
 
-    # Calculate livetime and nEvents for each run in a day
-    day_info = []
-    for date in d.keys():
-        for run, info in d[date].items():
-            ymd = Time(date, format='mjd', out_subfmt='date').iso
-            livetime = int((info['stop'] - info['start'])*86400)
-            day_info.append(f'{ymd} - {run} - {info["nEvents"]} - {livetime}')
-
-    # Save information in text file
-    with open(args.out, 'w') as outfile:
-        outfile.writelines('\n'.join(day_info))
+    p = argparse.ArgumentParser(
+            description='Extracts and stores nEvents and livetime from ' + \
+            'ROOT files, organized by each run in each day')
+    p.add_argument('-i', '--infiles', dest='infiles',
+            nargs='+',
+            help='File(s) to retrieve the information from')
+    p.add_argument('-o', '--out', dest='out',
+            help='Name of output text file to store info')
+    p.add_argument('--manifest', dest='manifest',
+            default=None,
+            help='Json file of {output: [infiles]} to process several ' + \
+            'days in one job (replaces -i and -o)')
+    p.add_argument('--engine', dest='engine',
+            default='root', choices=['root', 'uproot'],
+            help='Read events one at a time with PyROOT (root) or as ' + \
+            'ModJulDay/RunId arrays with uproot (uproot)')
+    p.add_argument('--step-size', dest='step_size',
+            default='100 MB',
+            help='Entries (ex: 500000) or memory (ex: "100 MB") read per ' + \
+            'chunk with the uproot engine. Use "all" for whole branches')
+    p.add_argument('--workers', dest='workers',
+            type=int, default=1,
+            help='Number of processes used to read input files')
+    p.add_argument('--checksum', dest='checksum',
+            default=False, action='store_true',
+            help='Identify input files by content checksum instead of ' + \
+            'size and modification time in the output key file')
+    p.add_argument('--goodrunfile', dest='goodrunfile',
+            default=None,
+            help='Good run list json. Adds event counts and livetime ' + \
+            'inside good-time windows to each line (uproot engine only)')
+    args = p.parse_args()
 
-    print(f'Finished. Information saved to {args.out}')
+    # Chunk size as a number of entries or a memory cap
+    step_size = args.step_size
+    if step_size.isdigit():
+        step_size = int(step_size)
+    if step_size == 'all':
+        step_size = None
+
+    # Good-time windows for masking events
+    goodtime = None
+    if args.goodrunfile != None:
+        if args.engine != 'uproot':
+            raise SystemExit('Good-time counts require --engine uproot')
+        goodtime = GoodRunList(args.goodrunfile).good_time_index()
+
+    readers = {'root':read_pyroot,
+               'uproot':partial(read_uproot, step_size=step_size,
+                                goodtime=goodtime)}
+    reader = readers[args.engine]
+
+    # Options recorded in each summary's key along with its inputs
+    options = extract_options(args.goodrunfile)
+
+    # Days to process: a single day from the command line, or a manifest
+    if args.manifest != None:
+        with open(args.manifest, 'r') as f:
+            jobs = json.load(f)
+    else:
+        jobs = {args.out: args.infiles}
+
+    # One process pool shared by all days
+    pool = None
+    if args.workers > 1:
+        pool = ProcessPoolExecutor(max_workers=args.workers)
+
+    for out, infiles in jobs.items():
+
+        # Days finished by an earlier (preempted) attempt of this job
+        if args.manifest != None and os.path.isfile(out):
+            if read_key(out) == input_key(infiles, args.checksum, options):
+                print(f'{out} already finished. Skipping...')
+                continue
+
+        extract(infiles, out, reader, pool=pool, checksum=args.checksum,
+                options=options)
+
+    if pool != None:
+        pool.shutdown()
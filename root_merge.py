@@ -1,42 +1,185 @@
 #!/usr/bin/env python
 
+##==========================================================================##
+## Merges the daily root summaries into root_summary.json. Parsed lines are ##
+## kept in one shard per config, with a manifest of the daily files (size   ##
+## and mtime) that went into it, so reruns only reread changed files        ##
+##==========================================================================##
+
+import argparse
 import json
+import os
 import re
 from glob import glob
 import directories as stab
+from summary_store import root_table, save_table, table_file
 from collections import defaultdict
 
+
+""" Load a json file, returning an empty dictionary if none exists yet """
+def load_json(path):
+
+    if not os.path.isfile(path):
+        return {}
+
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+
+""" Save a json file, replacing the old one only once fully written """
+def save_json(obj, path):
+
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+
+""" Parsed lines of a daily summary: [day, run, events, livetime(, good)] """
+def read_day_file(day_file):
+
+    with open(day_file, 'r') as f:
+        lines = f.readlines()
+
+    return [line.strip().split(' - ') for line in lines if line.strip()]
+
+
+
+""" Bring a config's shard up to date with its daily files. Returns the
+    updated shard ({file: rows}), manifest entries, and changed files """
+def update_shard(shard, manifest, day_files):
+
+    new_manifest = {}
+    changed = []
+    for day_file in day_files:
+        st = os.stat(day_file)
+        entry = manifest.get(day_file, {})
+        if entry.get('size') != st.st_size or \
+                entry.get('mtime') != st.st_mtime or day_file not in shard:
+            shard[day_file] = read_day_file(day_file)
+            changed.append(day_file)
+        new_manifest[day_file] = {'size': st.st_size, 'mtime': st.st_mtime,
+                                  'rows': len(shard[day_file])}
+
+    # Drop daily files that were removed
+    removed = [f for f in shard if f not in new_manifest]
+    for day_file in removed:
+        del shard[day_file]
+
+    return shard, new_manifest, changed + removed
+
+
+
+""" Whether a config's daily files (names, sizes, and mtimes) still match
+    its manifest entries, so its shard and merged data can be reused """
+def is_unchanged(manifest, day_files):
+
+    if sorted(manifest) != sorted(day_files):
+        return False
+
+    for day_file in day_files:
+        st = os.stat(day_file)
+        entry = manifest[day_file]
+        if entry.get('size') != st.st_size or \
+                entry.get('mtime') != st.st_mtime:
+            return False
+
+    return True
+
+
+
+""" Storage structure: cfg_data[day][run][events|livetime(|_good)] """
+def merge_shard(shard):
+
+    cfg_data = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+
+    for day_file in sorted(shard):
+        for day, run, ct, t, *good in shard[day_file]:
+            cfg_data[day][run]['events'] += int(ct)
+            cfg_data[day][run]['livetime'] += int(t)
+            # Optional counts and livetime inside good-time windows
+            if good:
+                cfg_data[day][run]['events_good'] += int(good[0])
+                cfg_data[day][run]['livetime_good'] += int(good[1])
+
+    return cfg_data
+
+
 if __name__ == "__main__":
 
+    p = argparse.ArgumentParser(
+            description='Merge daily root summaries into root_summary.json')
+    p.add_argument('--full', dest='full',
+            default=False, action='store_true',
+            help='Ignore existing shards and reread every daily summary')
+    args = p.parse_args()
+
     # Establish default project-specific paths
     stab.setup_dirs()
 
+    shard_dir = f'{stab.data}/root_shards'
+    os.makedirs(shard_dir, exist_ok=True)
+    manifest_file = f'{shard_dir}/manifest.json'
+    manifest = {} if args.full else load_json(manifest_file)
+
     # Storage structure: root_data[cfg][day][run][events|livetime]
-    root_data = defaultdict(lambda: defaultdict(
-                            lambda: defaultdict(
-                            lambda: defaultdict(int))))
+    summary_file = f'{stab.data}/root_summary.json'
 
     # Collect summary files for individual days
     day_files = sorted(glob(f'{stab.root_out}/*.txt'))
     configs = sorted(set([re.findall('IC86-\d{4}',f)[0] for f in day_files]))
+    cfg_files = {cfg:[f for f in day_files if cfg in f] for cfg in configs}
+
+    # Configs with daily files, shard, and store table all up to date keep
+    # their part of root_summary.json
+    skip = []
+    if not args.full and os.path.isfile(summary_file):
+        skip = [cfg for cfg in configs if cfg in manifest
+                and os.path.isfile(table_file('root', cfg))
+                and is_unchanged(manifest[cfg], cfg_files[cfg])]
+    removed = [cfg for cfg in manifest if cfg not in configs]
+
+    if len(skip) == len(configs) and removed == []:
+        print('No daily summaries changed. Nothing to merge')
+        raise SystemExit
+
+    root_data = {} if args.full else load_json(summary_file)
+
+    # Configs with no daily files left
+    for cfg in removed:
+        print(f'Removing {cfg} (no daily summaries found)...')
+        del manifest[cfg]
+        root_data.pop(cfg, None)
+        for old in [f'{shard_dir}/root_{cfg}.json', table_file('root', cfg)]:
+            if os.path.isfile(old):
+                os.remove(old)
 
     for cfg in configs:
 
-        print(f'Working on {cfg}...')
+        if cfg in skip and cfg in root_data:
+            print(f'Skipping {cfg} (no changed files)')
+            continue
+
+        shard_file = f'{shard_dir}/root_{cfg}.json'
+        shard = {} if args.full else load_json(shard_file)
 
-        cfg_files = [f for f in day_files if cfg in f]
-        cfg_data = []
+        shard, manifest[cfg], changed = update_shard(shard,
+                manifest.get(cfg, {}), cfg_files[cfg])
+        print(f'Working on {cfg} ({len(changed)} changed files)...')
 
-        for cfg_file in cfg_files:
-            with open(cfg_file, 'r') as f:
-                cfg_data += f.readlines()
+        if changed:
+            save_json(shard, shard_file)
 
-        cfg_data = [line.strip().split(' - ') for line in cfg_data]
+        root_data[cfg] = merge_shard(shard)
 
-        for day, run, ct, t in cfg_data:
-            root_data[cfg][day][run]['events'] += int(ct)
-            root_data[cfg][day][run]['livetime'] += int(t)
+        # Columnar copy for rate_finder.py
+        if changed or not os.path.isfile(table_file('root', cfg)):
+            table = root_table(cfg, root_data[cfg])
+            save_table(table, table_file('root', cfg))
 
-        with open(f'{stab.data}/root_summary.json', 'w') as f:
-            json.dump(root_data, f)
+    # Manifest only after the shards it describes are saved
+    save_json(manifest, manifest_file)
 
+    save_json(dict(sorted(root_data.items())), summary_file)
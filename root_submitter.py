@@ -1,11 +1,15 @@
 #!/usr/bin/env python
 
-from submitter.pysubmit import pysubmit
+from submitter.pysubmit import pysubmit_batch
+from submitter.packer import pack_jobs, seconds_per_byte
 import argparse
 from glob import glob
 import re
 import os
+import json
 import directories as stab
+from dst_index import index_file, load_index, select_files
+from dst_index import input_key, read_key, write_key, extract_options
 
 
 if __name__ == "__main__":
@@ -17,6 +21,12 @@ if __name__ == "__main__":
     p.add_argument('--test', dest='test',
             default=False, action='store_true',
             help='Option for running off cluster to test')
+    p.add_argument('--backend', dest='backend',
+            default='condor', choices=['condor', 'local'],
+            help='Submit jobs to condor or run them in a local process pool')
+    p.add_argument('--nproc', dest='nproc',
+            type=int, default=None,
+            help='Maximum number of simultaneous local jobs (default: all cores)')
     p.add_argument('-c', '--config', dest='config',
             help='Detector season [IC86-2011 - IC86-2022]')
     p.add_argument('-d', '--dates', dest='dates',
@@ -28,22 +38,74 @@ if __name__ == "__main__":
     p.add_argument('--overwrite', dest='overwrite',
             default=False, action='store_true',
             help='Overwrite existing output summary files')
+    p.add_argument('--engine', dest='engine',
+            default='root', choices=['root', 'uproot'],
+            help='Event reader used by root_extractor.py')
+    p.add_argument('--step-size', dest='step_size',
+            default='100 MB',
+            help='Entries or memory per chunk for the uproot engine')
+    p.add_argument('--memory', dest='memory',
+            type=int, default=2000,
+            help='Memory (MB) requested for each job')
+    p.add_argument('--workers', dest='workers',
+            type=int, default=1,
+            help='Processes (and cpus requested) for each job')
+    p.add_argument('--index', dest='index',
+            default=False, action='store_true',
+            help='Select files from the DST index (dst_index.py) ' + \
+            'instead of scanning the data directories')
+    p.add_argument('--runs', dest='runs',
+            nargs='*', default=None,
+            help='Only files containing these runs (requires --index)')
+    p.add_argument('--mjd-range', dest='mjd_range',
+            type=float, nargs=2, default=[None, None],
+            help='Only files overlapping this MJD range (requires --index)')
+    p.add_argument('--checksum', dest='checksum',
+            default=False, action='store_true',
+            help='Identify input files by content checksum instead of ' + \
+            'size and modification time when checking for stale summaries')
+    p.add_argument('--goodtime', dest='goodtime',
+            default=False, action='store_true',
+            help='Also count events and livetime inside good-time ' + \
+            'windows from the good run list (uproot engine only)')
+    p.add_argument('--pack-size', dest='pack_size',
+            type=float, default=None,
+            help='Pack days into jobs of about this many GB of input')
+    p.add_argument('--pack-time', dest='pack_time',
+            type=float, default=None,
+            help='Pack days into jobs of about this many seconds, using ' + \
+            'runtimes of finished jobs in the submitter folder')
+    p.add_argument('--days-per-job', dest='days_per_job',
+            type=int, default=1,
+            help='Number of consecutive days processed by each job ' + \
+            '(ignored when packing)')
     args = p.parse_args()
 
+    # Good-time counts are only read by the uproot engine (root_extractor.py)
+    if args.goodtime and args.engine != 'uproot':
+        p.error('--goodtime requires --engine uproot')
+
 
     # Output location for submitter files
     npx_out = f'{stab.home}/submitter'
 
     # Collect all files from specified detector configuration
-    prefix = '/data/ana/CosmicRay/Anisotropy/IceCube'
-    files = glob(f'{prefix}/{args.config}/**/*.root', recursive=True)
+    if args.index:
+        index = load_index(index_file(args.config))
+        tmin, tmax = args.mjd_range
+        files = select_files(index, dates=args.dates, runs=args.runs,
+                             tmin=tmin, tmax=tmax)
+    else:
+        prefix = '/data/ana/CosmicRay/Anisotropy/IceCube'
+        files = glob(f'{prefix}/{args.config}/**/*.root', recursive=True)
     files.sort()
 
     # Group all files according to a given date
     dates = args.dates
-    if dates == None:
+    if dates == None or args.index:
         dates = set([re.findall('\d{4}-\d{2}-\d{2}', f)[-1] for f in files])
     dates = sorted(dates)
+    all_dates = set(dates)
     if args.test:
         dates = dates[:2]
 
@@ -53,10 +115,28 @@ if __name__ == "__main__":
     header = [f'#!/bin/sh {cvmfs}', f'#METAPROJECT {meta}']
     # ROOT tools not automatically loaded
     header += ['export PYTHONPATH="$PYTHONPATH:${SROOT}/lib"']
-    # Request increased memory: 8 GB (shouldn't need more than 4)
-    sublines = ["request_memory = 2000"]  
-
-    # Run over all dates
+    # Chunked uproot reading keeps memory flat regardless of file size
+    sublines = [f"request_memory = {args.memory}"]
+    if args.workers > 1:
+        sublines += [f"request_cpus = {args.workers}"]
+
+    # Summaries whose day no longer has any input files (only meaningful
+    # when every day was selected)
+    selected = args.dates != None or args.runs != None or \
+               args.mjd_range != [None, None] or args.test
+    if not selected:
+        for out in sorted(glob(f'{args.outDir}/sum_{args.config}_*.txt')):
+            date = re.findall('\d{4}-\d{2}-\d{2}', out)[-1]
+            if date not in all_dates:
+                print(f'Warning: no input files found for {out}')
+
+    # Options that change a summary, recorded in its key
+    goodrunfile = f'{stab.data}/goodrunlist.json'
+    options = extract_options(goodrunfile if args.goodtime else None)
+
+    # Run over all dates, collecting commands and input sizes for each day
+    n_stale = 0
+    day_inputs, day_bytes = {}, {}
     for date in dates:
 
         # Limit to relevant files
@@ -65,14 +145,92 @@ if __name__ == "__main__":
             print(f'No files found for {date}! Skipping...')
             continue
 
-        # Run
-        files_i = ' '.join(files_i)
+        # Skip summaries made from the same input files
         out = f'{args.outDir}/sum_{args.config}_{date}.txt'
-        cmd = f'{stab.home}/root_extractor.py -i {files_i} -o {out}'
-
         if os.path.isfile(out) and not args.overwrite:
-            #print(f'Files {out} already exists! Skipping...')
-            continue
 
-        pysubmit(cmd, npx_out, test=args.test, header=header, sublines=sublines)
+            key = input_key(files_i, args.checksum, options)
+            old_key = read_key(out)
+
+            # Summaries from before keys were recorded (without good-time
+            # counts) are current if newer than all their inputs
+            if old_key == None and options == None:
+                t_out = os.path.getmtime(out)
+                if all([os.path.getmtime(f) < t_out for f in files_i]):
+                    write_key(out, key)
+                    old_key = key
+
+            if key == old_key:
+                #print(f'Files {out} already exists! Skipping...')
+                continue
+
+            print(f'Input files changed for {out}. Resubmitting...')
+            n_stale += 1
+
+        # Input size from the index when available
+        if args.index:
+            day_bytes[date] = sum([index[f]['size'] for f in files_i])
+        else:
+            day_bytes[date] = sum([os.path.getsize(f) for f in files_i])
+
+        day_inputs[date] = (out, files_i)
+
+    # Target input bytes per job
+    target = None
+    if args.pack_size != None:
+        target = args.pack_size * 1e9
+    if args.pack_time != None:
+        rate = seconds_per_byte(npx_out)
+        if rate == None:
+            raise SystemExit(f'No finished jobs found in {npx_out} to ' + \
+                             'estimate runtimes. Use --pack-size instead.')
+        print(f'Estimated throughput: {1e-6/rate:.1f} MB/s')
+        target = args.pack_time / rate
+
+    # One job per day, a fixed number of days, or days packed into jobs of
+    # similar size
+    days = list(day_inputs.keys())
+    if target != None:
+        jobs = pack_jobs(day_bytes, target)
+    else:
+        n = args.days_per_job
+        jobs = [days[i:i+n] for i in range(0, len(days), n)]
+    if len(jobs) != len(days):
+        print(f'{len(days)} day(s) grouped into {len(jobs)} job(s)')
+
+    # Options shared by every job
+    opts = f'--engine {args.engine} --step-size "{args.step_size}"'
+    opts += f' --workers {args.workers}'
+    if args.checksum:
+        opts += ' --checksum'
+    if args.goodtime:
+        opts += f' --goodrunfile {goodrunfile}'
+
+    cmds = []
+    manifest_dir = f'{npx_out}/manifests'
+    for job in jobs:
+
+        # Single days list their files directly
+        if len(job) == 1:
+            out, files_i = day_inputs[job[0]]
+            files_i = ' '.join(files_i)
+            cmd = f'{stab.home}/root_extractor.py -i {files_i} -o {out}'
+            cmds.append(f'{cmd} {opts}')
+            continue
 
+        # Multiple days are read by one worker from a manifest
+        os.makedirs(manifest_dir, exist_ok=True)
+        manifest = f'{manifest_dir}/{args.config}_{job[0]}_{job[-1]}.json'
+        with open(manifest, 'w') as f:
+            json.dump({day_inputs[date][0]:day_inputs[date][1]
+                       for date in job}, f)
+        cmd = f'{stab.home}/root_extractor.py --manifest {manifest}'
+        cmds.append(f'{cmd} {opts}')
+
+    pysubmit_batch(cmds, npx_out, test=args.test, header=header,
+                   sublines=sublines, backend=args.backend, nproc=args.nproc)
+    if not args.test and args.backend == 'condor':
+        print(f'{len(cmds)} job(s) submitted')
+
+    if n_stale != 0:
+        print(f'{n_stale} stale summaries resubmitted')
@@ -2,17 +2,200 @@
 
 ##=========================================================================##
 ## Associates runs with detector configuration by scanning level2 directories
+## Saved as a compact table of consecutive run ranges: [[first, last, cfg]]
 
+import os
 import re
 import json
+import argparse
+import numpy as np
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
 
-from glob import glob
 import directories as stab
 
+cfg_re = re.compile('IC\d+(?:\.\d{4})?')
+run_re = re.compile('Run\d{8}')
+
+
+""" Compact run -> detector configuration lookup using sorted run ranges """
+class RunConfigTable:
+
+    def __init__(self, ranges):
+
+        ranges = sorted(ranges)
+        self.first = np.array([r[0] for r in ranges], dtype=np.int64)
+        self.last = np.array([r[1] for r in ranges], dtype=np.int64)
+        self.configs = np.array([r[2] for r in ranges], dtype=str)
+        self._first = self.first.tolist()
+
+    """ Build ranges from a {run: cfg} dictionary, starting a new range
+        whenever the configuration changes or run numbers are skipped (runs
+        missing from the dictionary stay unknown) """
+    @classmethod
+    def from_dict(cls, run2cfg):
+
+        ranges = []
+        for run, cfg in sorted([(int(r), c) for r, c in run2cfg.items()]):
+            if ranges and ranges[-1][2] == cfg and run == ranges[-1][1] + 1:
+                ranges[-1][1] = run
+            else:
+                ranges.append([run, run, cfg])
+
+        return cls(ranges)
+
+    def ranges(self):
+        return [[int(i), int(j), str(c)]
+                for i, j, c in zip(self.first, self.last, self.configs)]
+
+    def __getitem__(self, run):
+
+        run = int(run)
+        i = bisect_right(self._first, run) - 1
+        if i < 0 or run > self.last[i]:
+            raise KeyError(run)
+        return str(self.configs[i])
+
+    def __contains__(self, run):
+        try: self[run]
+        except (KeyError, ValueError):
+            return False
+        return True
+
+    def get(self, run, default=None):
+        try: return self[run]
+        except (KeyError, ValueError):
+            return default
+
+    """ Configurations for an array of runs ('' for unknown runs) """
+    def configs_for_runs(self, runs):
+
+        runs = np.asarray(runs, dtype=np.int64)
+        i = np.searchsorted(self.first, runs, side='right') - 1
+        known = i >= 0
+        known[known] = runs[known] <= self.last[i[known]]
+        out = np.full(runs.shape, '', dtype=self.configs.dtype)
+        out[known] = self.configs[i[known]]
+        return out
+
+    def save(self, outfile):
+        with open(outfile, 'w') as f:
+            json.dump({'ranges':self.ranges()}, f)
+
+
+
+""" Load a run -> config table from either the range table or an older
+    {run: cfg} dictionary """
+def load_run2cfg(run2cfgfile):
+
+    with open(run2cfgfile, 'r') as f:
+        d = json.load(f)
+
+    if 'ranges' in d:
+        return RunConfigTable(d['ranges'])
+    return RunConfigTable.from_dict(d)
+
+
+
+""" Detector configuration (ex: IC86.2011, IC79) and run number of the
+    first file name in a directory that has both, or None """
+def first_run_cfg(entries):
+
+    for name in entries:
+        cfgs = cfg_re.findall(name)
+        runs = run_re.findall(name)
+        if cfgs and runs:
+            return runs[-1][-6:], cfgs[-1]
+
+    return None
+
+
+
+""" Runs and configurations in one level2 day directory. Files directly in
+    the day directory are checked by name; run directories are listed only
+    until a file names the configuration (tracked or not). Run directories
+    without such a file yet are returned as pending """
+def scan_day(day_dir):
+
+    runs, pending = {}, []
+
+    with os.scandir(day_dir) as it:
+        entries = sorted(it, key=lambda e: e.name)
+
+    files = [e.name for e in entries if not e.is_dir()]
+    for name in files:
+        found = first_run_cfg([name])
+        if found != None:
+            runs[found[0]] = found[1]
+
+    for e in entries:
+        if not e.is_dir() or not run_re.search(e.name):
+            continue
+        with os.scandir(e.path) as it:
+            found = first_run_cfg(sorted([f.name for f in it]))
+        if found == None:
+            pending.append(e.name)
+            continue
+        runs[found[0]] = found[1]
+
+    return runs, pending
+
+
+
+""" Runs and configurations for a level2 year directory, only rescanning
+    day directories that are new, modified, or have pending run directories
+    since the cached scan. The cache keeps runs of every configuration;
+    only runs of the given configs are returned, with the rescanned days """
+def scan_year(level2_dir, configs, cache, nthreads=8):
+
+    with os.scandir(level2_dir) as it:
+        days = {e.path:e.stat().st_mtime for e in it
+                if e.is_dir() and re.fullmatch('\d{4}', e.name)}
+
+    changed = [day for day, mtime in days.items() if day not in cache
+               or cache[day]['mtime'] != mtime or cache[day]['pending']]
+
+    with ThreadPoolExecutor(max_workers=nthreads) as pool:
+        results = pool.map(scan_day, changed)
+        for day, (runs, pending) in zip(changed, results):
+            cache[day] = {'mtime':days[day], 'runs':runs, 'pending':pending}
+
+    # Drop cached days that no longer exist
+    for day in [day for day in cache if day not in days]:
+        del cache[day]
+
+    runs = {}
+    for day in sorted(days):
+        runs.update({run:cfg for run, cfg in cache[day]['runs'].items()
+                     if cfg in configs})
+
+    return runs, changed
+
+
 
 if __name__ == "__main__":
 
     stab.setup_dirs()
+
+    p = argparse.ArgumentParser(
+            description='Associates runs with detector configurations')
+    p.add_argument('--cache', dest='cache',
+            default=f'{stab.data}/level2_cache.json',
+            help='Cache of scanned level2 day directories')
+    p.add_argument('--full', dest='full',
+            default=False, action='store_true',
+            help='Ignore the cache and rescan every directory')
+    p.add_argument('--nthreads', dest='nthreads',
+            type=int, default=8,
+            help='Number of directories listed at a time')
+    args = p.parse_args()
+
+    # Cached scan results: cache[day_dir][mtime|runs|pending]
+    cache = {}
+    if os.path.isfile(args.cache) and not args.full:
+        with open(args.cache, 'r') as f:
+            cache = json.load(f)
+
     d = {}
 
     # Collect all files from relevant years
@@ -23,23 +206,27 @@ if __name__ == "__main__":
 
         print(f'Working on {yy}...')
         prefix = f'/data/exp/IceCube/{yy}/filtered/level2'
+        if not os.path.isdir(prefix):
+            print(f'{prefix} not found! Skipping...')
+            continue
 
-        files = glob(f'{prefix}/????/**/*', recursive=True)
+        runs, changed = scan_year(prefix, configs, cache, args.nthreads)
+        print(f'Day directories rescanned: {len(changed)}')
 
-        print(f'Number of total files: {len(files)}')
         for cfg in configs:
-            files_i = [f for f in files if cfg in f]
-            runs = sorted(set([re.findall('Run\d{8}',f)[-1] for f in files_i]))
-            runs = [r[-6:] for r in runs]       # Only save the relevant number
-            if len(runs) != 0:
-                print(f'Runs for {cfg} : {len(runs)}')
+            runs_i = [run for run, c in runs.items() if c == cfg]
+            if len(runs_i) != 0:
+                print(f'Runs for {cfg} : {len(runs_i)}')
 
-            out_cfg = cfg.replace('.','-')
-            for run in runs:
-                d[run] = out_cfg
+        for run, cfg in runs.items():
+            d[run] = cfg.replace('.','-')
 
         print()
 
+    with open(args.cache, 'w') as f:
+        json.dump(cache, f)
+
     print('File collection complete! Saving...')
-    with open(f'{stab.data}/run2cfg.json', 'w') as f:
-        json.dump(d, f)
+    table = RunConfigTable.from_dict(d)
+    print(f'{len(d)} runs stored as {len(table.first)} run ranges')
+    table.save(f'{stab.data}/run2cfg.json')
@@ -241,6 +241,9 @@ def resubmit(npxdir, jobID):
     with open('2sub.sub','r') as f:
         lines = f.readlines()
 
+    # Batch submissions queue every job from a list. Only rerun this one
+    lines = ['queue\n' if l.startswith('queue') else l for l in lines]
+
     for key in d.keys():
         for i, l in enumerate(lines):
             if l.split(' ')[0].lower() == key:
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+#############################################################################
+## Groups work items (ex: days of root files) into jobs of similar cost.   ##
+## Costs are input sizes in bytes, optionally converted to seconds using   ##
+## the runtimes of finished jobs in the npx4 folders                       ##
+#############################################################################
+
+import os, json, heapq, math
+from glob import glob
+
+from submitter.getTime import getTime
+
+
+def pack_jobs(costs, target):
+
+    ## costs - dictionary of {item: cost}
+    ## target - desired cost per job
+    ## Returns a list of jobs (sorted lists of items), largest jobs first
+
+    total = sum(costs.values())
+    if total == 0 or target <= 0:
+        return [sorted(costs.keys())] if costs else []
+
+    # Number of jobs needed to stay near the target cost
+    nJobs = min(len(costs), max(1, math.ceil(total / target)))
+
+    # Largest items first, each into the currently cheapest job
+    jobs = [(0, i, []) for i in range(nJobs)]
+    heapq.heapify(jobs)
+    for item in sorted(costs, key=lambda k: (-costs[k], k)):
+        cost, i, items = heapq.heappop(jobs)
+        items.append(item)
+        heapq.heappush(jobs, (cost + costs[item], i, items))
+
+    jobs = sorted(jobs, key=lambda job: (-job[0], job[1]))
+    return [sorted(items) for cost, i, items in jobs if items]
+
+
+
+def job_inputs(exe):
+
+    # Input files listed after '-i' (or in a '--manifest' file) in an
+    # executable script
+    with open(exe, 'r') as f:
+        words = f.read().split()
+
+    infiles = []
+    recording = False
+    for i, word in enumerate(words):
+        if word == '--manifest' and os.path.isfile(words[i+1]):
+            with open(words[i+1], 'r') as f:
+                infiles += [infile for day in json.load(f).values()
+                            for infile in day]
+        if word == '-i':
+            recording = True
+            continue
+        if word.startswith('-') or word.startswith('"'):
+            recording = False
+        if recording and word.endswith('.root'):
+            infiles.append(word)
+
+    return infiles
+
+
+
+def seconds_per_byte(npxdir):
+
+    # Runtime per input byte from finished jobs (None without history)
+    t_total, bytes_total = 0., 0
+    for exe in glob('%s/npx4-execs/*.sh' % npxdir):
+
+        jobID = os.path.basename(exe)[:-3]
+        log = '%s/npx4-logs/%s.log' % (npxdir, jobID)
+        if not os.path.isfile(log):
+            continue
+        t = getTime(log)
+        if t == None:
+            continue
+
+        infiles = [f for f in job_inputs(exe) if os.path.isfile(f)]
+        if infiles == []:
+            continue
+
+        t_total += t
+        bytes_total += sum([os.path.getsize(f) for f in infiles])
+
+    if bytes_total == 0:
+        return None
+
+    return t_total / bytes_total
@@ -13,14 +13,23 @@
 ## - local - copies i/o files to/from condor scratch directory (beta)      ##
 ## - sublines - location for additional submission options                 ##
 ##    - replace eventually with actual options (like 'universe')           ##
+##                                                                         ##
+## pysubmit_batch takes a list of executables (and optional jobIDs) and    ##
+## submits them all as one cluster with a single condor_submit call        ##
+##                                                                         ##
+## backend='local' runs the jobs in a pool of nproc local processes        ##
+## instead, writing condor-style exec/log/out/error files                  ##
 #############################################################################
 
-import os, stat, random
+import os, stat, random, socket, subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 def pysubmit(executable, outdir, jobID=None,
               test=False, local=False, universe='vanilla',
               header=['#!/bin/bash'],
-              notification='never', sublines=None):
+              notification='never', sublines=None,
+              backend='condor', nproc=None):
 
     # Option for testing off cluster
     if test:
@@ -31,7 +40,146 @@ def pysubmit(executable, outdir, jobID=None,
 
     # Default naming for jobIDs if not specified
     if jobID == None:
+        jobID = new_jobIDs(outdir, 1)[0]
+
+    make_dirs(outdir)
+    write_exe(executable, outdir, jobID, header=header, local=local)
+
+    if backend == 'local':
+        run_local([jobID], outdir, nproc=nproc)
+        return
+
+    # Condor submission script
+    lines = [
+        "universe = %s" % universe,
+        "executable = %s/npx4-execs/%s.sh" % (outdir, jobID),
+        "log = %s/npx4-logs/%s.log" % (outdir, jobID),
+        "output = %s/npx4-out/%s.out" % (outdir, jobID),
+        "error = %s/npx4-error/%s.error" % (outdir, jobID),
+        "notification = %s" % notification,
+        "queue"
+    ]
+
+    submit(lines, outdir, sublines=sublines)
+
+
+
+def pysubmit_batch(executables, outdir, jobIDs=None,
+              test=False, local=False, universe='vanilla',
+              header=['#!/bin/bash'],
+              notification='never', sublines=None,
+              backend='condor', nproc=None):
+
+    if len(executables) == 0:
+        return []
+
+    # Option for testing off cluster (first executable only)
+    if test:
+        os.system(executables[0])
+        return []
+
+    # Default naming for jobIDs if not specified
+    if jobIDs == None:
+        jobIDs = new_jobIDs(outdir, len(executables))
+
+    make_dirs(outdir)
+    for executable, jobID in zip(executables, jobIDs):
+        write_exe(executable, outdir, jobID, header=header, local=local)
+
+    if backend == 'local':
+        run_local(jobIDs, outdir, nproc=nproc)
+        return jobIDs
+
+    # One jobID per line, read by condor's "queue ... from"
+    itemfile = '%s/2sub.jobs' % outdir
+    with open(itemfile, 'w') as f:
+        f.writelines(['%s\n' % jobID for jobID in jobIDs])
+
+    # Condor submission script shared by every job in the cluster
+    lines = [
+        "universe = %s" % universe,
+        "executable = %s/npx4-execs/$(jobID).sh" % outdir,
+        "log = %s/npx4-logs/$(jobID).log" % outdir,
+        "output = %s/npx4-out/$(jobID).out" % outdir,
+        "error = %s/npx4-error/$(jobID).error" % outdir,
+        "notification = %s" % notification,
+        "queue jobID from %s" % itemfile
+    ]
+
+    submit(lines, outdir, sublines=sublines)
+
+    return jobIDs
+
+
+
+# Unique default jobIDs, avoiding executables already in outdir
+def new_jobIDs(outdir, n):
+
+    taken = set()
+    execdir = '%s/npx4-execs' % outdir
+    if os.path.isdir(execdir):
+        taken = set([f.split('.')[0] for f in os.listdir(execdir)])
+
+    jobIDs = []
+    while len(jobIDs) < n:
         jobID = 'npx4-%05d' % random.uniform(0, 100000)
+        if jobID not in taken:
+            taken.add(jobID)
+            jobIDs.append(jobID)
+
+    return jobIDs
+
+
+
+# Run executables in a pool of local processes (nproc at a time)
+def run_local(jobIDs, outdir, nproc=None):
+
+    if nproc == None:
+        nproc = os.cpu_count()
+
+    with ThreadPoolExecutor(max_workers=nproc) as pool:
+        returncodes = list(pool.map(lambda j: run_job(j, outdir), jobIDs))
+
+    nFailed = len([r for r in returncodes if r != 0])
+    print('%i job(s) finished locally (%i failed)' % (len(jobIDs), nFailed))
+
+    return returncodes
+
+
+
+# Run one executable, mimicking the condor log so cleaner.py and
+# getTime.py can check local jobs
+def run_job(jobID, outdir):
+
+    exe = '%s/npx4-execs/%s.sh' % (outdir, jobID)
+    log = '%s/npx4-logs/%s.log' % (outdir, jobID)
+    out = '%s/npx4-out/%s.out' % (outdir, jobID)
+    err = '%s/npx4-error/%s.error' % (outdir, jobID)
+
+    def logline(code, message):
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return '%s (local.%s) %s %s\n' % (code, jobID, now, message)
+
+    with open(log, 'w') as f:
+        f.write(logline('000', 'Job submitted from host: <local>'))
+        f.write('...\n')
+        f.write(logline('001', 'Job executing on host: <%s>'
+                % socket.gethostname()))
+        f.write('...\n')
+
+    with open(out, 'w') as fout, open(err, 'w') as ferr:
+        returncode = subprocess.call(exe, stdout=fout, stderr=ferr)
+
+    with open(log, 'a') as f:
+        f.write(logline('005', 'Job terminated.'))
+        f.write('\t(1) Normal termination (return value %i)\n' % returncode)
+        f.write('...\n')
+
+    return returncode
+
+
+
+def make_dirs(outdir):
 
     # Ensure output directories exist
     if not os.path.isdir(outdir):
@@ -40,6 +188,10 @@ def pysubmit(executable, outdir, jobID=None,
         if not os.path.isdir('%s/npx4-%s' % (outdir, condorOut)):
             os.mkdir('%s/npx4-%s' % (outdir, condorOut))
 
+
+
+def write_exe(executable, outdir, jobID, header=['#!/bin/bash'], local=False):
+
     # Option to copy files to scratch directory
     ## NOTE: fails with copied i3 files (no permission to read?)
     # Input files must have '-f' argument
@@ -94,16 +246,12 @@ def pysubmit(executable, outdir, jobID=None,
     st = os.stat(outexe)
     os.chmod(outexe, st.st_mode | stat.S_IEXEC)
 
-    # Condor submission script
-    lines = [
-        "universe = %s" % universe,
-        "executable = %s/npx4-execs/%s.sh" % (outdir, jobID),
-        "log = %s/npx4-logs/%s.log" % (outdir, jobID),
-        "output = %s/npx4-out/%s.out" % (outdir, jobID),
-        "error = %s/npx4-error/%s.error" % (outdir, jobID),
-        "notification = %s" % notification,
-        "queue"
-    ]
+    return outexe
+
+
+
+def submit(lines, outdir, sublines=None):
+
     lines = [l+'\n' for l in lines]
 
     # Option for additional lines to submission script
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+##==========================================================================##
+## Columnar store for the root and fits summaries: one NumPy structured    ##
+## array per source and config (data/summary_store/[source]_[cfg].npy),    ##
+## sorted by day and run and loaded lazily with memory mapping             ##
+##==========================================================================##
+
+import argparse
+import json
+import os
+from glob import glob
+import numpy as np
+
+import directories as stab
+
+# One row per run (root) or per day (fits, run = -1). Counts inside good-time
+# windows are -1 where they were not recorded
+summary_dtype = np.dtype([
+    ('config', 'U12'),
+    ('day', 'datetime64[D]'),
+    ('run', np.int64),
+    ('events', np.int64),
+    ('livetime', np.int64),
+    ('events_good', np.int64),
+    ('livetime_good', np.int64),
+    ('source', 'U4')])
+
+sources = ['root', 'fits']
+
+
+""" Default location of the store """
+def store_dir(data_dir=None):
+    if data_dir == None:
+        data_dir = stab.data
+    return f'{data_dir}/summary_store'
+
+
+
+""" File holding one source (root|fits) for a detector configuration """
+def table_file(source, config, data_dir=None):
+    return f'{store_dir(data_dir)}/{source}_{config}.npy'
+
+
+
+""" Table of runs from nested root data: cfg_data[day][run][events|...] """
+def root_table(config, cfg_data):
+
+    rows = []
+    for day, runs in cfg_data.items():
+        for run, info in runs.items():
+            rows.append((config, day, int(run), info['events'],
+                         info['livetime'], info.get('events_good', -1),
+                         info.get('livetime_good', -1), 'root'))
+
+    return sort_table(np.array(rows, dtype=summary_dtype))
+
+
+
+""" Table of days from nested fits data: cfg_data[day][events|livetime] """
+def fits_table(config, cfg_data):
+
+    rows = [(config, day, -1, info['events'], info['livetime'], -1, -1,
+             'fits') for day, info in cfg_data.items()]
+
+    return sort_table(np.array(rows, dtype=summary_dtype))
+
+
+
+""" Rows in (day, run) order, so date ranges are contiguous slices """
+def sort_table(table):
+    return table[np.lexsort((table['run'], table['day']))]
+
+
+
+""" Save a table, replacing the old file only once fully written """
+def save_table(table, path):
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, table)
+    os.replace(tmp, path)
+
+
+
+""" Rows of one stored table inside a date range [start, stop], left
+    memory-mapped (only the slice is read from disk when used) """
+def load_table(path, start=None, stop=None, mmap=True):
+
+    table = np.load(path, mmap_mode='r' if mmap else None)
+
+    days = table['day']
+    i0, i1 = 0, len(table)
+    if start != None:
+        i0 = np.searchsorted(days, np.datetime64(start, 'D'), side='left')
+    if stop != None:
+        i1 = np.searchsorted(days, np.datetime64(stop, 'D'), side='right')
+
+    return table[i0:i1]
+
+
+
+""" Detector configurations present in the store for a source """
+def stored_configs(source, data_dir=None):
+
+    prefix = f'{store_dir(data_dir)}/{source}_'
+    files = sorted(glob(f'{prefix}*.npy'))
+
+    return [f[len(prefix):-len('.npy')] for f in files]
+
+
+
+""" Remove the stored tables of a source for configs not in keep """
+def remove_tables(source, keep, data_dir=None):
+
+    removed = [cfg for cfg in stored_configs(source, data_dir)
+               if cfg not in keep]
+    for cfg in removed:
+        os.remove(table_file(source, cfg, data_dir))
+
+    return removed
+
+
+
+""" Rebuild the tables of a source from its json summary
+    ([source]_summary.json). Returns {cfg: number of rows} """
+def convert_json(source, data_dir=None):
+
+    if data_dir == None:
+        data_dir = stab.data
+
+    with open(f'{data_dir}/{source}_summary.json', 'r') as f:
+        data = json.load(f)
+
+    builders = {'root':root_table, 'fits':fits_table}
+    nRows = {}
+    for cfg, cfg_data in sorted(data.items()):
+        table = builders[source](cfg, cfg_data)
+        save_table(table, table_file(source, cfg, data_dir))
+        nRows[cfg] = len(table)
+    remove_tables(source, data.keys(), data_dir)
+
+    return nRows
+
+
+
+""" All rows for the given source(s) and configs in a date range, as one
+    structured array (sorted by config, day, and run) """
+def load_summary(source=None, configs=None, start=None, stop=None,
+                 data_dir=None):
+
+    if source == None:
+        source = sources
+    if isinstance(source, str):
+        source = [source]
+
+    tables = []
+    for src in source:
+        cfgs = stored_configs(src, data_dir) if configs == None else configs
+        for cfg in sorted(cfgs):
+            path = table_file(src, cfg, data_dir)
+            if os.path.isfile(path):
+                tables.append(load_table(path, start, stop))
+
+    if tables == []:
+        return np.zeros(0, dtype=summary_dtype)
+
+    return np.concatenate(tables)
+
+
+if __name__ == "__main__":
+
+    p = argparse.ArgumentParser(
+            description='Build the columnar summary store from the json ' + \
+            'summaries made by root_merge.py and fits_merge.py')
+    p.add_argument('-s', '--sources', dest='sources',
+            nargs='+', default=sources, choices=sources,
+            help='Summaries to convert')
+    args = p.parse_args()
+
+    # Establish default project-specific paths
+    stab.setup_dirs()
+
+    for source in args.sources:
+        for cfg, nRows in convert_json(source).items():
+            print(f'{source} {cfg}: {nRows} rows')
+
+    print(f'Finished. Tables saved to {store_dir()}')